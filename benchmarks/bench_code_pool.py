@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+    Claims per second of the code pool with concurrent workers, each claim in its own transaction.
+    It needs the LMS database (MySQL 8 or PostgreSQL for SKIP LOCKED), run it on a test
+    database because the claimed codes are marked as used:
+        python manage.py lms shell < benchmarks/bench_code_pool.py
+"""
+# Python Standard Libraries
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+# Installed packages (via pip)
+from django.db import connection, transaction
+
+# Internal project dependencies
+from corfogeneratecode.code_pool import available_codes, claim_code, refill_pool
+
+CLAIMS = 5000
+WORKERS = [1, 4, 16]
+
+
+def claim(_):
+    try:
+        with transaction.atomic():
+            return claim_code()
+    finally:
+        connection.close()
+
+
+def run():
+    for workers in WORKERS:
+        start = time.perf_counter()
+        refill_pool(available_codes() + CLAIMS)
+        refill_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            codes = list(executor.map(claim, range(CLAIMS)))
+        elapsed = time.perf_counter() - start
+        assert None not in codes
+        assert len(set(codes)) == CLAIMS
+        print('workers: {:>2}, refill: {:.2f} s, claims: {:.0f}/s'.format(workers, refill_time, CLAIMS / elapsed))
+
+
+run()
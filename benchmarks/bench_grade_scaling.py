@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+    grade_percent_scaled (Decimal, one value) vs grade_percent_scaled_batch (NumPy) on one million grades
+
+    Run from the root of the project:
+        python benchmarks/bench_grade_scaling.py
+"""
+# Python Standard Libraries
+import time
+
+# Installed packages (via pip)
+import django
+from django.conf import settings
+import numpy as np
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+# Internal project dependencies
+from corfogeneratecode.grades import grade_percent_scaled, grade_percent_scaled_batch
+
+SIZE = 1000000
+GRADE_CUTOFF = 0.6
+
+
+if __name__ == '__main__':
+    percents = np.random.RandomState(0).random_sample(SIZE)
+    start = time.perf_counter()
+    batch = grade_percent_scaled_batch(percents, GRADE_CUTOFF)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar = [grade_percent_scaled(percent, GRADE_CUTOFF) for percent in percents.tolist()]
+    scalar_time = time.perf_counter() - start
+
+    assert batch.tolist() == scalar
+    print('scalar: {:.2f} s for {} grades'.format(scalar_time, SIZE))
+    print('batch:  {:.3f} s for {} grades'.format(batch_time, SIZE))
+    print('speedup: {:.0f}x'.format(scalar_time / batch_time))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+    Bare requests.post vs the pooled keep-alive session against a local stub of the CORFO token endpoint
+
+    Run from the root of the project:
+        python benchmarks/bench_http_session.py
+"""
+# Python Standard Libraries
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+# Installed packages (via pip)
+import django
+from django.conf import settings
+import requests
+
+if not settings.configured:
+    settings.configure(
+        CORFOGENERATE_HTTP_POOL_SIZE=10,
+        CORFOGENERATE_HTTP_CONNECT_TIMEOUT=3.05,
+        CORFOGENERATE_HTTP_READ_TIMEOUT=10,
+    )
+    django.setup()
+
+# Internal project dependencies
+from corfogeneratecode import client
+
+NUMBER = 500
+BODY = json.dumps({
+    "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+    "token_type": "Bearer",
+    "expires_in": 3599,
+    "scope": "resource.READ"
+}).encode('utf8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(post, url):
+    start = time.perf_counter()
+    for _ in range(NUMBER):
+        post(url, data={'grant_type': 'client_credentials'}).json()
+    return (time.perf_counter() - start) / NUMBER
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/token'.format(server.server_address[1])
+    bare = run(requests.post, url)
+    pooled = run(client.post, url)
+    server.shutdown()
+    print('requests.post:  {:.3f} ms/request'.format(bare * 1e3))
+    print('pooled session: {:.3f} ms/request'.format(pooled * 1e3))
+    print('speedup: {:.1f}x'.format(bare / pooled))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+    Cold vs warm render of static/html/corfogeneratecode.html
+
+    Run from the root of the project:
+        python benchmarks/bench_render_template.py
+"""
+# Python Standard Libraries
+import timeit
+
+# Installed packages (via pip)
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates'}],
+        CORFOGENERATE_TEMPLATE_CACHE=True,
+    )
+    django.setup()
+
+from django.template import Context
+
+# Internal project dependencies
+from corfogeneratecode.resources import clear_template_cache, get_template
+
+TEMPLATE = 'static/html/corfogeneratecode.html'
+NUMBER = 2000
+
+
+class FakeBlock(object):
+    display_title = 'Benchmark'
+    id_content = 200
+    content = 'benchmark'
+
+
+CONTEXT = {
+    'xblock': FakeBlock(),
+    'location': 'benchmark',
+    'passed': True,
+    'code': 'U1CODASDFGHJ',
+    'user_rut': '9472337K',
+    'corfo_save': True,
+    'status_settings': False
+}
+
+
+def cold_render():
+    clear_template_cache()
+    return get_template(TEMPLATE).render(Context(CONTEXT))
+
+
+def warm_render():
+    return get_template(TEMPLATE).render(Context(CONTEXT))
+
+
+if __name__ == '__main__':
+    cold = min(timeit.repeat(cold_render, number=NUMBER, repeat=5)) / NUMBER
+    warm_render()
+    warm = min(timeit.repeat(warm_render, number=NUMBER, repeat=5)) / NUMBER
+    print('cold render: {:.1f} us'.format(cold * 1e6))
+    print('warm render: {:.1f} us'.format(warm * 1e6))
+    print('speedup: {:.1f}x'.format(cold / warm))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+    EXPLAIN of the hot CorfoCodeUser queries, shows the index used by each one.
+    It needs the LMS database with the corfogeneratecode migrations applied:
+        python manage.py lms shell < benchmarks/explain_queries.py
+"""
+# Python Standard Libraries
+import datetime
+
+# Installed packages (via pip)
+from django.db import connection
+from django.utils import timezone
+
+# Internal project dependencies
+from corfogeneratecode.models import CorfoCodeUser
+
+ID_CONTENT = 200
+SINCE = timezone.now() - datetime.timedelta(days=30)
+
+
+def field_index_name(column):
+    """
+        Name of the index created by db_index=True on column
+    """
+    with connection.schema_editor() as schema_editor:
+        return schema_editor._create_index_name(CorfoCodeUser._meta.db_table, [column])
+
+
+# (description, queryset, index expected in the plan or None if it depends on the database)
+QUERIES = [
+    ('get CorfoCodeUser of user and id_content',
+        CorfoCodeUser.objects.filter(user_id=1, mapping_content__id_content=ID_CONTENT), None),
+    ('code lookup (admin search ^code)',
+        CorfoCodeUser.objects.filter(code__startswith='U1COD'), field_index_name('code')),
+    ('pending backlog (metrics gauge)',
+        CorfoCodeUser.objects.filter(corfo_save=False).exclude(code=''), 'corfo_user_pending_idx'),
+    ('pending codes of id_content since date (corfo_resubmit)',
+        CorfoCodeUser.objects.filter(corfo_save=False, mapping_content__id_content=ID_CONTENT, created_at__gte=SINCE), 'corfo_user_pending_idx'),
+    ('last codes (admin changelist ordering)',
+        CorfoCodeUser.objects.order_by('-created_at')[:100], field_index_name('created_at')),
+]
+
+
+def run():
+    print('Database: {}, rows: {}'.format(connection.vendor, CorfoCodeUser.objects.count()))
+    for description, queryset, index in QUERIES:
+        plan = queryset.explain()
+        print('\n== {}'.format(description))
+        print(plan)
+        if index is not None:
+            print('-> expected index {}: {}'.format(index, 'used' if index in plan else 'NOT USED'))
+
+
+run()
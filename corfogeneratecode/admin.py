@@ -1,14 +1,71 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .circuit_breaker import CLOSED, corfo_breaker
+from .export import csv_response
 from .models import CorfoCodeUser, CorfoCodeMappingContent, CorfoCodeInstitution
 
 # Register your models here.
 
+def get_estimated_count(model, using='default'):
+    """
+        Row count of model table from the database statistics, None if the database is not supported
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Use the estimated row count of the table instead of COUNT(*) when the
+        changelist is not filtered and the table is bigger than CORFOGENERATE_ADMIN_EXACT_COUNT_LIMIT
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is not None and not queryset.query.where:
+            estimate = get_estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > settings.CORFOGENERATE_ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+def export_csv(modeladmin, request, queryset):
+    return csv_response(queryset)
+export_csv.short_description = 'Exportar códigos seleccionados a CSV'
+
 
 class CorfoCodeUserAdmin(admin.ModelAdmin):
     raw_id_fields = ('user',)
     list_display = ('user', 'mapping_content', 'code', 'corfo_save', 'created_at')
-    search_fields = ['user__username', 'mapping_content__id_content','mapping_content__content', 'code', 'created_at']
+    list_select_related = ('user', 'mapping_content')
+    list_filter = ('corfo_save', ('created_at', admin.DateFieldListFilter), 'mapping_content')
+    search_fields = ['^code', '^user__username']
     ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [export_csv]
+
+    def changelist_view(self, request, extra_context=None):
+        state = corfo_breaker.get_state()
+        if state != CLOSED:
+            self.message_user(
+                request,
+                'Circuit breaker CORFO: {} ({} fallas consecutivas)'.format(state, corfo_breaker.get_failures()),
+                level=messages.WARNING)
+        extra_context = extra_context or {}
+        extra_context['corfo_breaker_state'] = state
+        return super(CorfoCodeUserAdmin, self).changelist_view(request, extra_context=extra_context)
 
 class CorfoCodeMappingContentAdmin(admin.ModelAdmin):
     list_display = ('id_content', 'content')
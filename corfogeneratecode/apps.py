@@ -20,4 +20,19 @@ class CorfoGenerateConfig(AppConfig):
                     PluginSettings.RELATIVE_PATH: "settings.common"}
                     },
         },
+        PluginURLs.CONFIG: {
+            ProjectType.CMS: {
+                PluginURLs.NAMESPACE: 'corfogeneratecode',
+                PluginURLs.REGEX: r'^corfogeneratecode/',
+                PluginURLs.RELATIVE_PATH: 'urls',
+            },
+            ProjectType.LMS: {
+                PluginURLs.NAMESPACE: 'corfogeneratecode',
+                PluginURLs.REGEX: r'^corfogeneratecode/',
+                PluginURLs.RELATIVE_PATH: 'urls',
+            },
+        },
     }
+
+    def ready(self):
+        from . import signals  # pylint: disable=unused-import
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+import time
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.core.cache import cache
+
+# Internal project dependencies
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """
+        Raised instead of calling CORFO while the circuit breaker is open
+    """
+
+class CircuitBreaker(object):
+    """
+        Circuit breaker shared by every worker through the django cache.
+        After CORFOGENERATE_BREAKER_THRESHOLD consecutive failures it opens and
+        rejects every call for CORFOGENERATE_BREAKER_COOLDOWN seconds, then it is
+        half open and lets one probe call at a time, a success close it again.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.failures_key = 'corfogeneratecode-breaker-{}-failures'.format(name)
+        self.opened_key = 'corfogeneratecode-breaker-{}-opened-at'.format(name)
+        self.probe_key = 'corfogeneratecode-breaker-{}-probe'.format(name)
+
+    def get_state(self):
+        opened_at = cache.get(self.opened_key)
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < settings.CORFOGENERATE_BREAKER_COOLDOWN:
+            return OPEN
+        return HALF_OPEN
+
+    def get_failures(self):
+        return cache.get(self.failures_key, 0)
+
+    def is_open(self):
+        return self.get_state() == OPEN
+
+    def allow_request(self):
+        """
+            Return True if a call to CORFO can be done now
+        """
+        state = self.get_state()
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and cache.add(self.probe_key, '1', settings.CORFOGENERATE_BREAKER_PROBE_TIMEOUT):
+            logger.info('CorfoGenerateCode - Circuit breaker {} half open, probe request'.format(self.name))
+            return True
+        metrics.increment('corfogeneratecode.breaker.rejected', tags={'breaker': self.name})
+        return False
+
+    def record_success(self):
+        current = cache.get_many([self.failures_key, self.opened_key])
+        if not current:
+            return
+        if self.opened_key in current:
+            logger.info('CorfoGenerateCode - Circuit breaker {} closed'.format(self.name))
+            metrics.gauge('corfogeneratecode.breaker.state', STATE_VALUES[CLOSED], tags={'breaker': self.name})
+        self.reset()
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self.failures_key, failures, None)
+        if failures >= settings.CORFOGENERATE_BREAKER_THRESHOLD or self.get_state() == HALF_OPEN:
+            self.open()
+
+    def open(self):
+        logger.error('CorfoGenerateCode - Circuit breaker {} open after {} failures'.format(self.name, self.get_failures()))
+        cache.set(self.opened_key, time.time(), None)
+        cache.delete(self.probe_key)
+        metrics.increment('corfogeneratecode.breaker.opened', tags={'breaker': self.name})
+        metrics.gauge('corfogeneratecode.breaker.state', STATE_VALUES[OPEN], tags={'breaker': self.name})
+
+    def reset(self):
+        cache.delete_many([self.failures_key, self.opened_key, self.probe_key])
+
+corfo_breaker = CircuitBreaker('corfo')
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+import random
+import threading
+import time
+
+# Installed packages (via pip)
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import requests
+
+# Internal project dependencies
+from . import metrics
+from .circuit_breaker import CircuitOpenError, corfo_breaker
+
+logger = logging.getLogger(__name__)
+
+# Outcomes where the request surely was not processed by CORFO
+RETRY_STATUS = (502, 503)
+# Outcomes where the request could have been processed, retried only if it is idempotent
+IDEMPOTENT_RETRY_STATUS = RETRY_STATUS + (504,)
+IDEMPOTENT_RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+# One keep-alive session per process, shared by every CORFO call
+_session = None
+_session_lock = threading.Lock()
+
+def build_session():
+    """
+       Create a requests.Session with a connection pool, without retries,
+       they are done by post_with_retry within CORFOGENERATE_RETRY_BUDGET
+    """
+    adapter = HTTPAdapter(
+        pool_connections=settings.CORFOGENERATE_HTTP_POOL_SIZE,
+        pool_maxsize=settings.CORFOGENERATE_HTTP_POOL_SIZE,
+        max_retries=0)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """
+       Get the per-process session used to call CORFO
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+def reset_session():
+    """
+       Close the per-process session, next call create a new one with current settings
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def get_timeout(remaining=None):
+    """
+       (connect, read) timeout in seconds for CORFO calls, each one at most remaining seconds
+    """
+    timeout = (settings.CORFOGENERATE_HTTP_CONNECT_TIMEOUT, settings.CORFOGENERATE_HTTP_READ_TIMEOUT)
+    if remaining is None:
+        return timeout
+    return tuple(min(value, remaining) for value in timeout)
+
+def get_max_request_time():
+    """
+       Worst case seconds of post_with_retry, the connect timeout of the last attempt ends
+       within the budget and its read timeout could go beyond it
+    """
+    return settings.CORFOGENERATE_RETRY_BUDGET + settings.CORFOGENERATE_HTTP_READ_TIMEOUT
+
+def request_not_sent(error):
+    """
+       True if error happened before the request was sent (connect timeout or connection refused),
+       CORFO could not have processed it
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+def is_retryable_error(error, idempotent):
+    if idempotent:
+        return isinstance(error, IDEMPOTENT_RETRY_EXCEPTIONS)
+    return request_not_sent(error)
+
+def post(url, **kwargs):
+    """
+       POST to CORFO through the pooled session with explicit timeouts.
+       Raise CircuitOpenError without calling CORFO while the circuit breaker is open
+    """
+    if not corfo_breaker.allow_request():
+        raise CircuitOpenError('CORFO circuit breaker is open')
+    kwargs.setdefault('timeout', get_timeout())
+    try:
+        response = get_session().post(url, **kwargs)
+    except Exception:
+        metrics.increment('corfogeneratecode.http.response', tags={'code': 'error'})
+        corfo_breaker.record_failure()
+        raise
+    metrics.increment('corfogeneratecode.http.response', tags={'code': '{}xx'.format(response.status_code // 100)})
+    if response.status_code >= 500:
+        corfo_breaker.record_failure()
+    else:
+        corfo_breaker.record_success()
+    return response
+
+def get_backoff(attempt):
+    """
+       Exponential backoff with full jitter, seconds to wait before retry number attempt
+    """
+    cap = min(settings.CORFOGENERATE_RETRY_BACKOFF_MAX, settings.CORFOGENERATE_RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+def post_with_retry(url, idempotent=False, **kwargs):
+    """
+       POST to CORFO retrying transient failures (errors before the request is sent and 502/503,
+       also any connection error, timeouts and 504 if idempotent) up to CORFOGENERATE_RETRY_MAX_ATTEMPTS
+       attempts and while the CORFOGENERATE_RETRY_BUDGET seconds allow it, the timeouts of
+       each attempt are cut to the seconds left in the budget.
+       Return the last response or raise the last exception
+    """
+    retry_status = IDEMPOTENT_RETRY_STATUS if idempotent else RETRY_STATUS
+    deadline = time.time() + settings.CORFOGENERATE_RETRY_BUDGET
+    attempt = 0
+    while True:
+        attempt += 1
+        error = None
+        kwargs['timeout'] = get_timeout(max(deadline - time.time(), 0.1))
+        try:
+            response = post(url, **kwargs)
+            if response.status_code not in retry_status:
+                return response
+            reason = response.status_code
+        except requests.RequestException as e:
+            if not is_retryable_error(e, idempotent):
+                raise
+            error = e
+            reason = type(e).__name__
+        delay = get_backoff(attempt)
+        if attempt >= settings.CORFOGENERATE_RETRY_MAX_ATTEMPTS or time.time() + delay >= deadline:
+            if error is not None:
+                raise error
+            return response
+        logger.warning('CorfoGenerateCode - Retry {} to {} in {:.2f}s, reason: {}'.format(attempt, url, delay, reason))
+        metrics.increment('corfogeneratecode.http.retry')
+        time.sleep(delay)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.db import connection
+from django.utils.crypto import get_random_string
+
+# Internal project dependencies
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Same alphabet as BaseUserManager().make_random_password(8).upper(), without I, O, 0 and 1
+CODE_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 8
+
+def random_code():
+    return get_random_string(CODE_LENGTH, CODE_CHARS)
+
+def available_codes():
+    from .models import CorfoCodePool
+    return CorfoCodePool.objects.filter(used=False).count()
+
+def refill_pool(size=None, batch_size=None):
+    """
+        Add random codes until the pool has size unused codes, duplicates
+        are dropped by the unique index. Return the number of codes added
+    """
+    from .models import CorfoCodePool
+    size = size if size is not None else settings.CORFOGENERATE_CODE_POOL_SIZE
+    batch_size = batch_size or settings.CORFOGENERATE_CODE_POOL_BATCH_SIZE
+    start = available_codes()
+    available = start
+    while available < size:
+        codes = set(random_code() for _ in range(min(batch_size, size - available)))
+        CorfoCodePool.objects.bulk_create([CorfoCodePool(code=code) for code in codes], ignore_conflicts=True)
+        available = available_codes()
+    logger.info('CorfoGenerateCode - Code pool refilled, added: {}, available: {}'.format(available - start, available))
+    return available - start
+
+def claim_code():
+    """
+        Take one unused code from the pool, concurrent claims skip the rows locked
+        by each other. Must be called inside transaction.atomic(). None if the pool is empty
+    """
+    from .models import CorfoCodePool
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = CorfoCodePool.objects.select_for_update(skip_locked=True)
+    else:
+        queryset = CorfoCodePool.objects.select_for_update()
+    claimed = queryset.filter(used=False).order_by('pk').values_list('pk', 'code').first()
+    if claimed is None:
+        logger.warning('CorfoGenerateCode - Code pool is empty, run corfo_code_pool to refill it')
+        metrics.increment('corfogeneratecode.code_pool.empty')
+        return None
+    CorfoCodePool.objects.filter(pk=claimed[0]).update(used=True)
+    return claimed[1]
@@ -1,11 +1,10 @@
 # Python Standard Libraries
 import logging
-import pkg_resources
 import six
 
 # Installed packages (via pip)
 from django.conf import settings as DJANGO_SETTINGS
-from django.template import Context, Template
+from django.template import Context
 
 # Edx dependencies
 from xblock.core import XBlock
@@ -14,6 +13,10 @@ from xblock.fragment import Fragment
 from xblockutils.resources import ResourceLoader
 from xblockutils.studio_editable import StudioEditableXBlockMixin
 
+# Internal project dependencies
+from . import metrics
+from .resources import add_css, add_javascript, get_asset, get_template
+
 log = logging.getLogger(__name__)
 loader = ResourceLoader(__name__)
 # Make '_' a no-op so we can scrape strings
@@ -75,8 +78,7 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
 
     def resource_string(self, path):
         """Handy helper for getting resources from our kit."""
-        data = pkg_resources.resource_string(__name__, path)
-        return data.decode("utf8")
+        return get_asset(path)[0]
 
     @reify
     def block_course_id(self):
@@ -105,48 +107,53 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
         template = self.render_template(
             'static/html/author_view.html', context)
         frag = Fragment(template)
-        frag.add_css(self.resource_string("static/css/corfogeneratecode.css"))
+        add_css(frag, "static/css/corfogeneratecode.css")
         return frag
 
     def studio_view(self, context):
         """
         Render a form for editing this XBlock
         """
-        from .models import CorfoCodeMappingContent, CorfoCodeInstitution
+        from .reference_data import get_reference_data
         fragment = Fragment()
+        reference_data = get_reference_data()
 
         context = {
             'xblock': self,
             'location': str(self.location).split('@')[-1],
-            'list_content': CorfoCodeMappingContent.objects.all().values('id_content', 'content'),
-            'list_institution': CorfoCodeInstitution.objects.all().values('id_institution', 'institution')
+            'list_content': reference_data.list_contents(),
+            'list_institution': reference_data.list_institutions()
         }
         context['len_list_institution'] = len(context['list_institution'])
         fragment.content = loader.render_django_template(
             'static/html/studio_view.html', context)
-        fragment.add_css(self.resource_string("static/css/corfogeneratecode.css"))
-        fragment.add_javascript(self.resource_string(
-            "static/js/src/corfogeneratecode_studio.js"))
+        add_css(fragment, "static/css/corfogeneratecode.css")
+        add_javascript(fragment, "static/js/src/corfogeneratecode_studio.js")
         fragment.initialize_js('CorfoGenerateXBlock')
         return fragment
 
+    @metrics.timed_request('student_view')
     def student_view(self, context=None):
         context = self.get_context()
         template = self.render_template(
             'static/html/corfogeneratecode.html', context)
         frag = Fragment(template)
-        frag.add_css(self.resource_string("static/css/corfogeneratecode.css"))
-        frag.add_javascript(self.resource_string(
-            "static/js/src/corfogeneratecode.js"))
+        add_css(frag, "static/css/corfogeneratecode.css")
+        add_javascript(frag, "static/js/src/corfogeneratecode.js")
         frag.initialize_js('CorfoGenerateXBlock')
         return frag
 
     def get_context(self):
         data = self.get_corfo_user_data()
+        if data['corfo_save'] and data['code'] != '':
+            # Confirmed code is shown whatever the grade is, skip the grade computation
+            passed = True
+        else:
+            passed = self.user_course_passed()
         context = {
             'xblock': self,
             'location': str(self.location).split('@')[-1],
-            'passed': self.user_course_passed(),
+            'passed': passed,
             'code': data['code'],
             'user_rut': self.get_user_rut(),
             'corfo_save': data['corfo_save'],
@@ -154,13 +161,33 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
         }
         return context
 
+    def get_corfo_user(self):
+        """
+            Get CorfoCodeUser with user.edxloginuser and mapping_content in a single query.
+            The result is memoized on the block for the current user and id_content.
+        """
+        from .models import CorfoCodeUser
+        key = (self.scope_ids.user_id, self.id_content)
+        cached = self.__dict__.get('_corfo_user')
+        if cached is None or cached[0] != key:
+            try:
+                with metrics.stage('corfo_user'):
+                    corfouser = CorfoCodeUser.objects.select_related('user__edxloginuser', 'mapping_content').get(
+                        user=self.scope_ids.user_id, mapping_content__id_content=self.id_content)
+            except CorfoCodeUser.DoesNotExist:
+                corfouser = None
+            cached = (key, corfouser)
+            self.__dict__['_corfo_user'] = cached
+        return cached[1]
+
     def get_user_rut(self):
         """
             Get user data from EdxLoginUser model
         """
-        from .models import CorfoCodeUser
+        corfouser = self.get_corfo_user()
+        if corfouser is None:
+            return ''
         try:
-            corfouser = CorfoCodeUser.objects.get(user=self.scope_ids.user_id, mapping_content__id_content=self.id_content)
             aux_run = corfouser.user.edxloginuser.run
             if aux_run[0] == 'P':
                 return aux_run
@@ -169,23 +196,34 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
             else:
                 run = str(int(aux_run[:-1])) + aux_run[-1]
                 return run
-        except (CorfoCodeUser.DoesNotExist, AttributeError, ValueError) as e:
+        except (AttributeError, ValueError) as e:
             return ''
 
     def get_corfo_user_data(self):
-        from .models import CorfoCodeUser
-        try:
-            corfouser = CorfoCodeUser.objects.get(user=self.scope_ids.user_id, mapping_content__id_content=self.id_content)
-            return {'code': corfouser.code, 'corfo_save': corfouser.corfo_save}
-        except CorfoCodeUser.DoesNotExist:
+        corfouser = self.get_corfo_user()
+        if corfouser is None:
             return {'code': '', 'corfo_save': False}
+        return {'code': corfouser.code, 'corfo_save': corfouser.corfo_save}
 
+    @metrics.timed('grade')
     def user_course_passed(self):
         from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
         from django.contrib.auth.models import User
+        from .grades import get_cached_course_grade, read_persistent_grade, set_cached_course_grade
+        from .views import get_course_edited_on
+        grade = get_cached_course_grade(self.scope_ids.user_id, self.course_id)
+        if grade is not None:
+            return grade[0]
+        grade = read_persistent_grade(self.scope_ids.user_id, self.course_id, get_course_edited_on(self.course_id))
+        if grade is not None:
+            metrics.increment('corfogeneratecode.grade.read', tags={'source': 'persistent'})
+            set_cached_course_grade(self.scope_ids.user_id, self.course_id, *grade)
+            return grade[0]
+        metrics.increment('corfogeneratecode.grade.read', tags={'source': 'live'})
         try:
             user = User.objects.get(id=self.scope_ids.user_id)
             response = CourseGradeFactory().read(user, course_key=self.course_id)
+            set_cached_course_grade(user.id, self.course_id, response.passed, response.percent)
             return response.passed
         except User.DoesNotExist:
             return False
@@ -209,6 +247,7 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
             return {'result': 'error'}
 
     @XBlock.json_handler
+    @metrics.timed_request('generate_code')
     def generate_code(self, data, suffix=''):
         from .views import generate_code
         from django.contrib.auth.models import User
@@ -219,19 +258,28 @@ class CorfoGenerateXBlock(StudioEditableXBlockMixin, XBlock):
         except User.DoesNotExist:
             return {'result':'error', 'status': 5, 'message': 'Usuario no ha iniciado sesión, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
 
-    def validate_content(self, id_cont, cont, id_institution):
-        from .models import CorfoCodeMappingContent, CorfoCodeInstitution
+    @XBlock.json_handler
+    def generate_code_status(self, data, suffix=''):
+        from .views import get_submission_status
+        from django.contrib.auth.models import User
         try:
-            corfomapping = CorfoCodeMappingContent.objects.get(id_content=id_cont, content=cont)
-            if id_institution != 3093:
-                institution = CorfoCodeInstitution.objects.get(id_institution=id_institution)
-            return True
-        except (CorfoCodeMappingContent.DoesNotExist, CorfoCodeInstitution.DoesNotExist) as e:
+            user = User.objects.get(id=self.scope_ids.user_id)
+            return get_submission_status(user, self.id_content)
+        except User.DoesNotExist:
+            return {'result':'error', 'status': 5, 'message': 'Usuario no ha iniciado sesión, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+
+    def validate_content(self, id_cont, cont, id_institution):
+        from .reference_data import get_reference_data
+        reference_data = get_reference_data()
+        corfomapping = reference_data.get_content(id_cont)
+        if corfomapping is None or corfomapping['content'] != cont:
+            return False
+        if id_institution != 3093 and reference_data.get_institution(id_institution) is None:
             return False
+        return True
 
     def render_template(self, template_path, context):
-        template_str = self.resource_string(template_path)
-        template = Template(template_str)
+        template = get_template(template_path)
         return template.render(Context(context))
 
     # workbench while developing your XBlock.
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import csv
+import datetime
+import logging
+from operator import attrgetter, itemgetter
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+logger = logging.getLogger(__name__)
+
+EXPORT_HEADER = ['username', 'email', 'rut', 'id_content', 'content', 'code', 'corfo_save', 'created_at']
+EXPORT_FIELDS = (
+    'user__username',
+    'user__email',
+    'user__edxloginuser__run',
+    'mapping_content__id_content',
+    'mapping_content__content',
+    'code',
+    'corfo_save',
+    'created_at')
+
+class Echo(object):
+    """
+        File-like object that return the written value instead of keeping it
+    """
+    def write(self, value):
+        return value
+
+def start_of_day(date):
+    """
+        Aware datetime at 00:00 of date, to filter created_at by a range the index can use
+    """
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+def export_queryset(id_content=None, since=None, corfo_save=None):
+    """
+        CorfoCodeUser rows to export, filtered by id_content, created since date and corfo_save
+    """
+    from .models import CorfoCodeUser
+    queryset = CorfoCodeUser.objects.all()
+    if id_content is not None:
+        queryset = queryset.filter(mapping_content__id_content=id_content)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=start_of_day(since))
+    if corfo_save is not None:
+        queryset = queryset.filter(corfo_save=corfo_save)
+    return queryset
+
+def iter_chunks(queryset, chunk_size, get_pk=attrgetter('pk')):
+    """
+        Lists of at most chunk_size rows of queryset ordered by pk, one query per chunk
+        filtered by the last pk read (keyset pagination). queryset.iterator() is not used,
+        the MySQL driver loads the whole result of a query in memory
+    """
+    queryset = queryset.order_by('pk')
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        chunk = list(queryset.filter(pk__gt=get_pk(chunk[-1]))[:chunk_size])
+
+def iter_rows(queryset, chunk_size=None):
+    """
+        Header and one row per CorfoCodeUser of queryset, read from the
+        database by chunks of chunk_size rows without model instances
+    """
+    from .views import format_rut
+    chunk_size = chunk_size or settings.CORFOGENERATE_EXPORT_CHUNK_SIZE
+    yield EXPORT_HEADER
+    chunks = iter_chunks(queryset.values_list('pk', *EXPORT_FIELDS), chunk_size, itemgetter(0))
+    rows = (row for chunk in chunks for row in chunk)
+    for _, username, email, run, id_content, content, code, corfo_save, created_at in rows:
+        yield [
+            username,
+            email,
+            format_rut(run) or '',
+            id_content if id_content is not None else '',
+            content or '',
+            code,
+            corfo_save,
+            timezone.localtime(created_at).isoformat() if created_at else '']
+
+def write_csv(rows, output):
+    writer = csv.writer(output)
+    for row in rows:
+        writer.writerow(row)
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+def csv_response(queryset, filename='corfo_codes.csv'):
+    """
+        StreamingHttpResponse with the CSV export of queryset
+    """
+    response = StreamingHttpResponse(stream_csv(iter_rows(queryset)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+def export_codes(request):
+    """
+        Staff only view, CSV export of the issued codes,
+        filtered by id_content, since (YYYY-MM-DD) and corfo_save (0/1)
+    """
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden()
+    try:
+        id_content = int(request.GET['id_content']) if request.GET.get('id_content') else None
+        since = parse_date(request.GET['since']) if request.GET.get('since') else None
+    except ValueError:
+        return HttpResponseBadRequest()
+    if request.GET.get('since') and since is None:
+        return HttpResponseBadRequest()
+    corfo_save = request.GET.get('corfo_save')
+    if corfo_save in ('0', '1'):
+        corfo_save = corfo_save == '1'
+    else:
+        corfo_save = None
+    return csv_response(export_queryset(id_content, since, corfo_save))
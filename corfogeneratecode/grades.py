@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+from decimal import Decimal, ROUND_HALF_UP
+import logging
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.core.cache import cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COURSE_GRADE_CACHE_KEY = 'corfogeneratecode-grade-{}-{}'
+GRADE_CUTOFF_CACHE_KEY = 'corfogeneratecode-grade-cutoff-{}'
+COURSE_EDITED_ON_CACHE_KEY = 'corfogeneratecode-course-edited-on-{}'
+# Distance to a rounding tie under which float64 and Decimal could round differently
+ROUND_TIE_TOLERANCE = 1e-6
+GRADE_SOURCE_LIVE = 'live'
+GRADE_SOURCE_PERSISTENT = 'persistent'
+
+def course_grade_cache_key(user_id, course_key):
+    return COURSE_GRADE_CACHE_KEY.format(user_id, str(course_key))
+
+def get_cached_course_grade(user_id, course_key):
+    """
+        Get (passed, percent) of user in course from cache, None if it is not cached
+    """
+    grade = cache.get(course_grade_cache_key(user_id, course_key))
+    if grade is None:
+        return None
+    return tuple(grade)
+
+def set_cached_course_grade(user_id, course_key, passed, percent):
+    """
+        Save (passed, percent) of user in course for CORFOGENERATE_GRADE_CACHE_TIMEOUT seconds
+    """
+    cache.set(course_grade_cache_key(user_id, course_key), (passed, percent), settings.CORFOGENERATE_GRADE_CACHE_TIMEOUT)
+
+def clear_cached_course_grade(user_id, course_key):
+    cache.delete(course_grade_cache_key(user_id, course_key))
+
+def read_persistent_grade(user_id, course_key, course_edited_on):
+    """
+        Get (passed, percent) of user in course from its PersistentCourseGrade row with one indexed query.
+        None if CORFOGENERATE_GRADE_SOURCE is live, the row does not exist or it was computed
+        for a version of the course older than course_edited_on (last publish of the course)
+    """
+    if settings.CORFOGENERATE_GRADE_SOURCE != GRADE_SOURCE_PERSISTENT or course_edited_on is None:
+        return None
+    from lms.djangoapps.grades.models import PersistentCourseGrade
+    try:
+        grade = PersistentCourseGrade.objects.only('percent_grade', 'letter_grade', 'course_edited_timestamp').get(user_id=user_id, course_id=course_key)
+    except PersistentCourseGrade.DoesNotExist:
+        return None
+    if grade.course_edited_timestamp is None or grade.course_edited_timestamp < course_edited_on:
+        logger.info('CorfoGenerateCode - PersistentCourseGrade is stale, user: {}, course: {}, grade course version: {}, course edited on: {}'.format(user_id, str(course_key), grade.course_edited_timestamp, course_edited_on))
+        return None
+    # letter_grade is empty when the percent is under every grade cutoff
+    return bool(grade.letter_grade), grade.percent_grade
+
+def grade_cutoff_cache_key(course_key):
+    return GRADE_CUTOFF_CACHE_KEY.format(str(course_key))
+
+def get_cached_grade_cutoff(course_key):
+    """
+        Get min grade cutoff of course from cache, None if it is not cached
+    """
+    return cache.get(grade_cutoff_cache_key(course_key))
+
+def set_cached_grade_cutoff(course_key, grade_cutoff):
+    """
+        Save min grade cutoff of course for CORFOGENERATE_GRADE_CUTOFF_CACHE_TIMEOUT seconds
+    """
+    cache.set(grade_cutoff_cache_key(course_key), grade_cutoff, settings.CORFOGENERATE_GRADE_CUTOFF_CACHE_TIMEOUT)
+
+def clear_cached_grade_cutoff(course_key):
+    cache.delete(grade_cutoff_cache_key(course_key))
+
+def course_edited_on_cache_key(course_key):
+    return COURSE_EDITED_ON_CACHE_KEY.format(str(course_key))
+
+def get_cached_course_edited_on(course_key):
+    """
+        Get the last publish datetime of course from cache, None if it is not cached
+    """
+    return cache.get(course_edited_on_cache_key(course_key))
+
+def set_cached_course_edited_on(course_key, edited_on):
+    """
+        Save the last publish datetime of course for CORFOGENERATE_GRADE_CUTOFF_CACHE_TIMEOUT seconds
+    """
+    cache.set(course_edited_on_cache_key(course_key), edited_on, settings.CORFOGENERATE_GRADE_CUTOFF_CACHE_TIMEOUT)
+
+def clear_cached_course_edited_on(course_key):
+    cache.delete(course_edited_on_cache_key(course_key))
+
+def grade_percent_scaled(grade_percent, grade_cutoff):
+    """
+        EOL: Scale grade percent by grade cutoff. Grade between 1.0 - 7.0
+    """
+    if grade_percent == 0.:
+        return 1.
+    if grade_percent < grade_cutoff:
+        return round_up((Decimal('3') / Decimal(str(grade_cutoff)) * Decimal(str(grade_percent)) + Decimal('1')))
+    return round_up(Decimal('3') / Decimal(str(1. - grade_cutoff)) * Decimal(str(grade_percent)) + (Decimal('7') - (Decimal('3') / Decimal(str(1. - grade_cutoff)))))
+
+def round_up(number):
+    return float(Decimal(str(float(number))).quantize(Decimal('0.1'), ROUND_HALF_UP))
+
+def grade_percent_scaled_batch(grade_percents, grade_cutoff):
+    """
+        EOL: Vectorized grade_percent_scaled for reports and backfills.
+        Scale an array of grade percents by grade cutoff, grades between 1.0 - 7.0 rounded half up.
+        Values that fall on a rounding tie (x.x5) are computed with grade_percent_scaled,
+        so the result is always the same as the scalar version.
+    """
+    percents = np.asarray(grade_percents, dtype=np.float64)
+    below_slope = 3. / grade_cutoff
+    above_slope = 3. / (1. - grade_cutoff)
+    tenths = 10. * np.where(
+        percents < grade_cutoff,
+        below_slope * percents + 1.,
+        above_slope * percents + (7. - above_slope))
+    scaled = np.asarray(np.floor(tenths + 0.5) / 10.)
+    scaled[percents == 0.] = 1.
+    ties = (np.abs(tenths - np.floor(tenths) - 0.5) < ROUND_TIE_TOLERANCE) & (percents != 0.)
+    for index in np.flatnonzero(ties):
+        scaled.flat[index] = grade_percent_scaled(float(percents.flat[index]), grade_cutoff)
+    return scaled
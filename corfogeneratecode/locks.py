@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+from contextlib import contextmanager
+import uuid
+
+# Installed packages (via pip)
+from django.core.cache import cache
+
+
+def acquire_lock(key, timeout):
+    """
+        Try to take a lock shared by every worker using cache.add, it expires after
+        timeout seconds if the worker dies. Return the token of the lock or None
+    """
+    token = uuid.uuid4().hex
+    if cache.add(key, token, timeout):
+        return token
+    return None
+
+def release_lock(key, token):
+    """
+        Release the lock if it is still held with token, a lock that expired
+        and was taken by other worker is not released
+    """
+    if cache.get(key) == token:
+        cache.delete(key)
+
+@contextmanager
+def cache_lock(key, timeout):
+    """
+        Yield True if the lock was acquired, it is released when the block ends
+    """
+    token = acquire_lock(key, timeout)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            release_lock(key, token)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+
+# Installed packages (via pip)
+from django.core.management.base import BaseCommand
+
+# Internal project dependencies
+from corfogeneratecode.code_pool import available_codes, refill_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Top up the pool of pre-generated codes used by generate_code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None, help='Unused codes to keep in the pool, CORFOGENERATE_CODE_POOL_SIZE by default')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=None)
+
+    def handle(self, *args, **options):
+        added = refill_pool(options['size'], options['batch_size'])
+        self.stdout.write('Added: {}, available: {}'.format(added, available_codes()))
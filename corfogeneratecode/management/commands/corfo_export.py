@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import io
+import logging
+
+# Installed packages (via pip)
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+# Internal project dependencies
+from corfogeneratecode.export import export_queryset, iter_rows, write_csv
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Export the issued CORFO codes (user, email, rut, content, code) to CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='CSV file, stdout if it is not set')
+        parser.add_argument('--id-content', type=int, dest='id_content', default=None, help='Only export this id_content')
+        parser.add_argument('--since', default=None, help='Only export codes created since this date (YYYY-MM-DD)')
+        parser.add_argument('--pending', action='store_true', help='Only export codes not confirmed by CORFO (corfo_save=False)')
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=None)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('Invalid --since date: {}'.format(options['since']))
+        corfo_save = False if options['pending'] else None
+        queryset = export_queryset(options['id_content'], since, corfo_save)
+        rows = iter_rows(queryset, options['chunk_size'])
+        if options['output']:
+            with io.open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                write_csv(rows, output)
+        else:
+            write_csv(rows, self.stdout)
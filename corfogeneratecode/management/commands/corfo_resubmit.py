@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import threading
+import time
+
+# Installed packages (via pip)
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+# Edx dependencies
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+# Internal project dependencies
+from corfogeneratecode import metrics
+from corfogeneratecode.export import iter_chunks, start_of_day
+from corfogeneratecode.models import CorfoCodeUser
+from corfogeneratecode.reference_data import get_reference_data
+from corfogeneratecode.views import get_credentential, get_grade_cutoff, get_user_rut, grade_percent_scaled, user_course_passed, validate_mooc
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(object):
+    """
+        Allow at most rate calls per second shared by every thread
+    """
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate > 0 else 0.
+        self.next_call = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Command(BaseCommand):
+    help = 'Resubmit to CORFO the codes that were generated but not confirmed (corfo_save=False)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', required=True, help='Course id used to compute the grade of the users')
+        parser.add_argument('--id-content', type=int, dest='id_content', required=True,
+            help='id_content of the codes to resubmit, the one configured in the blocks of --course (CorfoCodeUser does not store the course)')
+        parser.add_argument('--id-institution', type=int, dest='id_institution', required=True,
+            help='id_institution sent to CORFO, the one configured in the blocks of the codes (CorfoCodeUser does not store it)')
+        parser.add_argument('--since', default=None, help='Only resubmit codes created since this date (YYYY-MM-DD)')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', help='Show the codes to resubmit without calling CORFO')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent requests to CORFO')
+        parser.add_argument('--rate', type=float, default=5., help='Max requests per second to CORFO, 0 to disable')
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=500)
+
+    def handle(self, *args, **options):
+        try:
+            course_key = CourseKey.from_string(options['course'])
+        except InvalidKeyError:
+            raise CommandError('Invalid course id: {}'.format(options['course']))
+        if get_reference_data().get_content(options['id_content']) is None:
+            raise CommandError('Unknown id_content: {}'.format(options['id_content']))
+        if options['id_institution'] != 3093 and get_reference_data().get_institution(options['id_institution']) is None:
+            raise CommandError('Unknown id_institution: {}'.format(options['id_institution']))
+        grade_cutoff = get_grade_cutoff(course_key)
+        if grade_cutoff is None:
+            raise CommandError('Course {} has no grade cutoff'.format(course_key))
+
+        queryset = CorfoCodeUser.objects.filter(
+            corfo_save=False,
+            mapping_content__id_content=options['id_content'],
+            user__courseenrollment__course_id=course_key
+        ).exclude(code='').select_related('user__edxloginuser', 'mapping_content')
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('Invalid date: {}'.format(options['since']))
+            queryset = queryset.filter(created_at__gte=start_of_day(since))
+
+        dry_run = options['dry_run']
+        if not dry_run and get_credentential() is None:
+            raise CommandError('Error to get CORFO token')
+
+        limiter = RateLimiter(options['rate'])
+        stats = {'total': 0, 'skipped': 0, 'submitted': 0, 'success': 0, 'error': 0}
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for chunk in iter_chunks(queryset, options['chunk_size']):
+                pending = []
+                for corfouser in chunk:
+                    stats['total'] += 1
+                    submission = self.prepare(corfouser, course_key, grade_cutoff)
+                    if submission is None:
+                        stats['skipped'] += 1
+                    elif dry_run:
+                        self.stdout.write('Would resubmit user: {}, code: {}, score: {}'.format(corfouser.user.username, corfouser.code, submission[2]))
+                    else:
+                        pending.append(submission)
+                if not pending:
+                    continue
+                submit = partial(self.submit, limiter, get_credentential(), options['id_institution'])
+                for (corfouser, user_rut, score), response in zip(pending, executor.map(submit, pending)):
+                    stats['submitted'] += 1
+                    if response['result'] == 'success':
+                        stats['success'] += 1
+                        CorfoCodeUser.objects.filter(pk=corfouser.pk).update(corfo_save=True, created_at=timezone.now())
+                        metrics.increment('corfogeneratecode.code.confirmed')
+                    else:
+                        stats['error'] += 1
+        elapsed = time.time() - start
+        self.stdout.write(
+            'Rows: {total}, skipped: {skipped}, submitted: {submitted}, success: {success}, error: {error}'.format(**stats))
+        self.stdout.write('Elapsed: {:.1f}s, throughput: {:.1f} rows/s'.format(elapsed, stats['total'] / elapsed if elapsed else 0.))
+
+    def prepare(self, corfouser, course_key, grade_cutoff):
+        """
+            Return (corfouser, user_rut, score) or None if the code can't be submitted
+        """
+        user_rut = get_user_rut(corfouser)
+        if user_rut is None:
+            logger.info('CorfoGenerateCode - Resubmit skip user without rut, user: {}'.format(corfouser.user))
+            return None
+        passed, percent = user_course_passed(corfouser.user, course_key, force=True)
+        if not passed:
+            logger.info('CorfoGenerateCode - Resubmit skip user not passed, user: {}'.format(corfouser.user))
+            return None
+        return (corfouser, user_rut, grade_percent_scaled(percent, grade_cutoff))
+
+    def submit(self, limiter, token, id_institution, submission):
+        corfouser, user_rut, score = submission
+        limiter.wait()
+        return validate_mooc(token, corfouser.code, str(score), corfouser.mapping_content.id_content, user_rut, corfouser.user.email, id_institution)
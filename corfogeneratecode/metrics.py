@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+from contextlib import contextmanager
+from functools import wraps
+import logging
+import threading
+import time
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_BACKEND = 'corfogeneratecode.prometheus.CacheMetricsBackend'
+# (backend paths, backend instance) loaded by this process
+_backend = None
+# RequestTimer of the request running in the current thread
+_local = threading.local()
+
+class MetricsBackend(object):
+    """
+        Default metrics backend, drop every metric.
+        Set CORFOGENERATE_METRICS_BACKEND with the dotted path of a subclass to emit them.
+    """
+    def increment(self, name, value=1, tags=None):
+        pass
+
+    def gauge(self, name, value, tags=None):
+        pass
+
+    def timing(self, name, value, tags=None):
+        """
+            value in milliseconds, a histogram in the backend
+        """
+        pass
+
+class CompositeMetricsBackend(MetricsBackend):
+    """
+        Send every metric to each one of backends, a failing backend does not stop the others
+    """
+    def __init__(self, backends):
+        self.backends = backends
+
+    def emit(self, method, name, *args):
+        for backend in self.backends:
+            try:
+                getattr(backend, method)(name, *args)
+            except Exception:
+                logger.exception('CorfoGenerateCode - Error to emit metric {} in {}'.format(name, type(backend).__name__))
+
+    def increment(self, name, value=1, tags=None):
+        self.emit('increment', name, value, tags)
+
+    def gauge(self, name, value, tags=None):
+        self.emit('gauge', name, value, tags)
+
+    def timing(self, name, value, tags=None):
+        self.emit('timing', name, value, tags)
+
+def get_backend_paths():
+    """
+        Dotted paths of CORFOGENERATE_METRICS_BACKEND (one path or a list of them),
+        and the Prometheus backend if CORFOGENERATE_METRICS_PROMETHEUS is enabled
+    """
+    paths = settings.CORFOGENERATE_METRICS_BACKEND or []
+    if isinstance(paths, str):
+        paths = [paths]
+    paths = list(paths)
+    if settings.CORFOGENERATE_METRICS_PROMETHEUS and PROMETHEUS_BACKEND not in paths:
+        paths.append(PROMETHEUS_BACKEND)
+    return tuple(paths)
+
+def get_backend():
+    global _backend
+    paths = get_backend_paths()
+    if _backend is None or _backend[0] != paths:
+        backends = [import_string(path)() for path in paths]
+        if not backends:
+            backend = MetricsBackend()
+        elif len(backends) == 1:
+            backend = backends[0]
+        else:
+            backend = CompositeMetricsBackend(backends)
+        _backend = (paths, backend)
+    return _backend[1]
+
+def increment(name, value=1, tags=None):
+    """
+        Increment counter name, a failing backend never break the request
+    """
+    try:
+        get_backend().increment(name, value, tags)
+    except Exception:
+        logger.exception('CorfoGenerateCode - Error to emit metric {}'.format(name))
+
+def gauge(name, value, tags=None):
+    """
+        Set gauge name, a failing backend never break the request
+    """
+    try:
+        get_backend().gauge(name, value, tags)
+    except Exception:
+        logger.exception('CorfoGenerateCode - Error to emit metric {}'.format(name))
+
+def timing(name, value, tags=None):
+    """
+        Record a duration in milliseconds, a failing backend never break the request
+    """
+    try:
+        get_backend().timing(name, value, tags)
+    except Exception:
+        logger.exception('CorfoGenerateCode - Error to emit metric {}'.format(name))
+
+class RequestTimer(object):
+    """
+        Duration of each stage of a request, emitted as corfogeneratecode.<name>.<stage>
+        histograms and logged in one line when the request ends
+    """
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.fields = {}
+        self.start = time.time()
+
+    def add(self, stage, elapsed):
+        self.stages.append((stage, elapsed))
+        timing('corfogeneratecode.{}.{}'.format(self.name, stage), elapsed)
+
+    def finish(self):
+        total = (time.time() - self.start) * 1000
+        timing('corfogeneratecode.{}.total'.format(self.name), total)
+        items = ['request={}'.format(self.name), 'total={:.1f}ms'.format(total)]
+        items.extend('{}={:.1f}ms'.format(stage, elapsed) for stage, elapsed in self.stages)
+        items.extend('{}={}'.format(key, value) for key, value in sorted(self.fields.items()))
+        logger.info('CorfoGenerateCode - timing {}'.format(' '.join(items)))
+
+def get_request_timer():
+    return getattr(_local, 'timer', None)
+
+@contextmanager
+def request_timer(name):
+    """
+        Time the stages of a request, nested request_timer use the outer one
+    """
+    outer = get_request_timer()
+    if outer is not None:
+        yield outer
+        return
+    timer = RequestTimer(name)
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = None
+        timer.finish()
+
+@contextmanager
+def stage(name):
+    """
+        Time a stage of the current request, outside a request only the histogram is emitted
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = (time.time() - start) * 1000
+        timer = get_request_timer()
+        if timer is not None:
+            timer.add(name, elapsed)
+        else:
+            timing('corfogeneratecode.stage.{}'.format(name), elapsed)
+
+def timed(name):
+    """
+        Decorator, time each call of the function as stage name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timed_request(name):
+    """
+        Decorator, time the function as request name, the status of a dict response
+        (or its result if it has no status) is logged and counted
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if get_request_timer() is not None:
+                return func(*args, **kwargs)
+            with request_timer(name) as timer:
+                response = func(*args, **kwargs)
+                if isinstance(response, dict):
+                    timer.fields['result'] = response.get('result')
+                    if 'status' in response:
+                        timer.fields['status'] = response['status']
+                    status = response.get('status', response.get('result'))
+                    increment('corfogeneratecode.{}.result'.format(name), tags={'status': str(status)})
+                return response
+        return wrapper
+    return decorator
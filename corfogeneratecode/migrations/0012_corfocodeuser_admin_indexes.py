@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corfogeneratecode', '0011_auto_20210413_1515'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='corfocodeuser',
+            name='code',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='corfocodeuser',
+            name='created_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
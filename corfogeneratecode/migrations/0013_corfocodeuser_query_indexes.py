@@ -0,0 +1,21 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corfogeneratecode', '0012_corfocodeuser_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='corfocodeuser',
+            index_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='corfocodeuser',
+            index=models.Index(fields=['corfo_save', 'mapping_content', 'created_at'], name='corfo_user_pending_idx'),
+        ),
+    ]
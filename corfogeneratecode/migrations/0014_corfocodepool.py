@@ -0,0 +1,25 @@
+# Generated by Django 2.2.19 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corfogeneratecode', '0013_corfocodeuser_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorfoCodePool',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=8, unique=True)),
+                ('used', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='corfocodepool',
+            index=models.Index(fields=['used'], name='corfo_code_pool_used_idx'),
+        ),
+    ]
@@ -18,19 +18,34 @@ class CorfoCodeInstitution(models.Model):
     def __str__(self):
         return '(%s) -> %s' % (self.id_institution, self.institution)
 
-class CorfoCodeUser(models.Model):
+class CorfoCodePool(models.Model):
+    """
+        Pre-generated random part of the codes, claimed once by generate_code_corfo
+    """
     class Meta:
-        index_together = [
-            ["user", "mapping_content"],
+        indexes = [
+            models.Index(fields=['used'], name='corfo_code_pool_used_idx'),
         ]
+    code = models.CharField(max_length=8, unique=True)
+    used = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.code
+
+class CorfoCodeUser(models.Model):
+    class Meta:
         unique_together = [
             ["user", "mapping_content"],
         ]
+        indexes = [
+            # Unconfirmed codes by content and date (backlog, corfo_resubmit, pending export)
+            models.Index(fields=['corfo_save', 'mapping_content', 'created_at'], name='corfo_user_pending_idx'),
+        ]
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE)
-    code = models.CharField(max_length=20, blank=True)
-    created_at = models.DateTimeField(auto_now=True, blank=True)
+    code = models.CharField(max_length=20, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now=True, blank=True, db_index=True)
     corfo_save = models.BooleanField(default=False)
     mapping_content = models.ForeignKey(
         CorfoCodeMappingContent,
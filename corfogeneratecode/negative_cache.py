@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.core.cache import cache
+
+# Internal project dependencies
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_CACHE_KEY = 'corfogeneratecode-negative-{}-{}-{}'
+# generate_code status that can be cached, 0 user dont passed course, 2 user without valid rut
+NOT_PASSED = 0
+NO_RUT = 2
+NEGATIVE_STATUS = (NOT_PASSED, NO_RUT)
+
+def negative_cache_key(user_id, id_content, status):
+    return NEGATIVE_CACHE_KEY.format(user_id, id_content, status)
+
+def get_negative_result(user_id, id_content):
+    """
+        Get the cached error response of user in id_content, None if it is not cached
+    """
+    responses = cache.get_many([negative_cache_key(user_id, id_content, status) for status in NEGATIVE_STATUS])
+    if not responses:
+        return None
+    metrics.increment('corfogeneratecode.negative_cache.hit')
+    return next(iter(responses.values()))
+
+def set_negative_result(user_id, id_content, response):
+    """
+        Save the error response of user in id_content for CORFOGENERATE_NEGATIVE_CACHE_TIMEOUT seconds
+    """
+    cache.set(negative_cache_key(user_id, id_content, response['status']), response, settings.CORFOGENERATE_NEGATIVE_CACHE_TIMEOUT)
+
+def clear_negative_results(user_id, status):
+    """
+        Drop the cached status responses of user in every id_content
+    """
+    from .reference_data import get_reference_data
+    contents = get_reference_data().list_contents()
+    cache.delete_many([negative_cache_key(user_id, content['id_content'], status) for content in contents])
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+# Internal project dependencies
+from .circuit_breaker import STATE_VALUES, corfo_breaker
+from .metrics import MetricsBackend
+
+logger = logging.getLogger(__name__)
+
+METRIC_CACHE_KEY = 'corfogeneratecode-metric-{}'
+BACKLOG_CACHE_KEY = 'corfogeneratecode-metric-backlog'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# (metric name, exported name, help, label, label values) of every exported counter
+COUNTERS = [
+    ('corfogeneratecode.generate_code.result', 'corfogeneratecode_generate_code_total',
+        'generate_code responses by status', 'status', ['success', 'pending', '0', '1', '2', '3', '4', '5', '6', '7']),
+    ('corfogeneratecode.token.hit', 'corfogeneratecode_token_hit_total', 'CORFO token found in cache', None, None),
+    ('corfogeneratecode.token.miss', 'corfogeneratecode_token_miss_total', 'CORFO token missing in cache', None, None),
+    ('corfogeneratecode.token.refresh', 'corfogeneratecode_token_refresh_total', 'CORFO token refreshed', None, None),
+    ('corfogeneratecode.grade.read', 'corfogeneratecode_grade_reads_total',
+        'Grades read by source, persisted grade or live CourseGradeFactory', 'source', ['persistent', 'live']),
+    ('corfogeneratecode.http.response', 'corfogeneratecode_http_responses_total',
+        'CORFO HTTP responses by status class', 'code', ['2xx', '3xx', '4xx', '5xx', 'error']),
+    ('corfogeneratecode.http.retry', 'corfogeneratecode_http_retries_total', 'CORFO HTTP requests retried', None, None),
+    ('corfogeneratecode.code.generated', 'corfogeneratecode_codes_generated_total', 'Codes generated', None, None),
+    ('corfogeneratecode.code.confirmed', 'corfogeneratecode_codes_confirmed_total', 'Codes confirmed by CORFO', None, None),
+    ('corfogeneratecode.negative_cache.hit', 'corfogeneratecode_negative_cache_hit_total', 'Error responses served from the negative cache', None, None),
+    ('corfogeneratecode.code_pool.empty', 'corfogeneratecode_code_pool_empty_total', 'Codes generated with the code pool empty', None, None),
+    ('corfogeneratecode.breaker.opened', 'corfogeneratecode_breaker_opened_total', 'Circuit breaker opened', 'breaker', ['corfo']),
+    ('corfogeneratecode.breaker.rejected', 'corfogeneratecode_breaker_rejected_total', 'Calls rejected by the circuit breaker', 'breaker', ['corfo']),
+]
+
+# Requests and stages timed by metrics.RequestTimer, "stage" are the stages timed outside a request
+TIMING_REQUESTS = ['generate_code', 'generate_code_status', 'student_view', 'stage']
+TIMING_STAGES = ['total', 'validate', 'corfo_user', 'corfo_user_lock', 'grade', 'grade_cutoff', 'token', 'validate_mooc']
+# Upper bounds in seconds of the duration histogram buckets
+TIMING_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+TIMING_LABELS = ['{}'.format(bucket) for bucket in TIMING_BUCKETS] + ['+Inf']
+
+def metric_key(name, tags=None):
+    if tags:
+        name = '{}-{}'.format(name, '-'.join('{}'.format(tags[tag]) for tag in sorted(tags)))
+    return METRIC_CACHE_KEY.format(name)
+
+def timing_key(request, stage, label):
+    return metric_key('corfogeneratecode.timing.{}.{}'.format(request, stage), {'le': label})
+
+def timing_sum_key(request, stage):
+    return metric_key('corfogeneratecode.timing.{}.{}.sum'.format(request, stage))
+
+def incr(key, value):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        cache.set(key, value, None)
+
+class CacheMetricsBackend(MetricsBackend):
+    """
+        Keep the counters and the stage timings in the django cache, shared by every
+        worker, to be scraped from export_metrics. A timing increments only its own bucket,
+        the cumulative buckets are computed by render_metrics
+    """
+    def increment(self, name, value=1, tags=None):
+        incr(metric_key(name, tags), value)
+
+    def timing(self, name, value, tags=None):
+        parts = name.split('.')
+        if len(parts) != 3 or parts[1] not in TIMING_REQUESTS or parts[2] not in TIMING_STAGES:
+            return
+        seconds = value / 1000.
+        label = next((label for bucket, label in zip(TIMING_BUCKETS, TIMING_LABELS) if seconds <= bucket), '+Inf')
+        incr(timing_key(parts[1], parts[2], label), 1)
+        incr(timing_sum_key(parts[1], parts[2]), int(round(value)))
+
+def get_backlog():
+    """
+        Number of generated codes not confirmed by CORFO,
+        counted at most once every CORFOGENERATE_METRICS_BACKLOG_TIMEOUT seconds
+    """
+    from .models import CorfoCodeUser
+    backlog = cache.get(BACKLOG_CACHE_KEY)
+    if backlog is None:
+        backlog = CorfoCodeUser.objects.filter(corfo_save=False).exclude(code='').count()
+        cache.set(BACKLOG_CACHE_KEY, backlog, settings.CORFOGENERATE_METRICS_BACKLOG_TIMEOUT)
+    return backlog
+
+def get_series():
+    """
+        (exported name, labels, cache key) of every counter serie
+    """
+    for name, exported, help_text, label, values in COUNTERS:
+        if label is None:
+            yield exported, '', metric_key(name)
+        else:
+            for value in values:
+                yield exported, '{{{}="{}"}}'.format(label, value), metric_key(name, {label: value})
+
+def render_metrics():
+    """
+        Counters and gauges in the Prometheus text format
+    """
+    series = list(get_series())
+    counts = cache.get_many([key for _, _, key in series])
+    lines = []
+    for name, exported, help_text, label, values in COUNTERS:
+        lines.append('# HELP {} {}'.format(exported, help_text))
+        lines.append('# TYPE {} counter'.format(exported))
+        lines.extend('{}{} {}'.format(exported, labels, counts.get(key, 0)) for serie, labels, key in series if serie == exported)
+    lines.extend(render_timings())
+    lines.append('# HELP corfogeneratecode_pending_codes Codes generated and not confirmed by CORFO')
+    lines.append('# TYPE corfogeneratecode_pending_codes gauge')
+    lines.append('corfogeneratecode_pending_codes {}'.format(get_backlog()))
+    lines.append('# HELP corfogeneratecode_breaker_state Circuit breaker state, 0 closed, 1 half open, 2 open')
+    lines.append('# TYPE corfogeneratecode_breaker_state gauge')
+    lines.append('corfogeneratecode_breaker_state{{breaker="{}"}} {}'.format(corfo_breaker.name, STATE_VALUES[corfo_breaker.get_state()]))
+    return '\n'.join(lines) + '\n'
+
+def render_timings():
+    """
+        Histogram of the stage timings with at least one observation, in seconds
+    """
+    series = [(request, stage) for request in TIMING_REQUESTS for stage in TIMING_STAGES]
+    keys = [timing_key(request, stage, label) for request, stage in series for label in TIMING_LABELS]
+    keys.extend(timing_sum_key(request, stage) for request, stage in series)
+    values = cache.get_many(keys)
+    lines = [
+        '# HELP corfogeneratecode_stage_duration_seconds Duration of each stage of the requests',
+        '# TYPE corfogeneratecode_stage_duration_seconds histogram']
+    for request, stage in series:
+        counts = [values.get(timing_key(request, stage, label), 0) for label in TIMING_LABELS]
+        if not any(counts):
+            continue
+        labels = 'request="{}",stage="{}"'.format(request, stage)
+        cumulative = 0
+        for label, count in zip(TIMING_LABELS, counts):
+            cumulative += count
+            lines.append('corfogeneratecode_stage_duration_seconds_bucket{{{},le="{}"}} {}'.format(labels, label, cumulative))
+        lines.append('corfogeneratecode_stage_duration_seconds_sum{{{}}} {}'.format(labels, values.get(timing_sum_key(request, stage), 0) / 1000.))
+        lines.append('corfogeneratecode_stage_duration_seconds_count{{{}}} {}'.format(labels, cumulative))
+    return lines
+
+def export_metrics(request):
+    """
+        Metrics endpoint, allowed with the CORFOGENERATE_METRICS_TOKEN bearer token or for staff users.
+        Not found if CORFOGENERATE_METRICS_PROMETHEUS is disabled, the counters are not recorded
+    """
+    if not settings.CORFOGENERATE_METRICS_PROMETHEUS:
+        raise Http404()
+    token = settings.CORFOGENERATE_METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token))
+    else:
+        allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
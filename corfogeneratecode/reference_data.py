@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+import uuid
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_VERSION_KEY = 'corfogeneratecode-reference-data-version'
+REFERENCE_DATA_CACHE_KEY = 'corfogeneratecode-reference-data-{}'
+
+# Snapshot loaded by this process, reused while its version is the current one
+_snapshot = None
+
+class ReferenceData(object):
+    """
+        Snapshot of CorfoCodeMappingContent and CorfoCodeInstitution tables
+        with dict lookups by id_content and id_institution
+    """
+    def __init__(self, version, contents, institutions):
+        self.version = version
+        self.contents = {content['id_content']: content for content in contents}
+        self.institutions = {institution['id_institution']: institution for institution in institutions}
+
+    def get_content(self, id_content):
+        """
+            Get {'id', 'id_content', 'content'} of id_content or None
+        """
+        return self.contents.get(id_content)
+
+    def get_institution(self, id_institution):
+        """
+            Get {'id', 'id_institution', 'institution'} of id_institution or None
+        """
+        return self.institutions.get(id_institution)
+
+    def list_contents(self):
+        return sorted(self.contents.values(), key=lambda content: content['id'])
+
+    def list_institutions(self):
+        return sorted(self.institutions.values(), key=lambda institution: institution['id'])
+
+def get_version():
+    version = cache.get(REFERENCE_DATA_VERSION_KEY)
+    if version is None:
+        cache.add(REFERENCE_DATA_VERSION_KEY, uuid.uuid4().hex, settings.CORFOGENERATE_REFERENCE_DATA_TIMEOUT)
+        version = cache.get(REFERENCE_DATA_VERSION_KEY)
+    return version
+
+def load_reference_data():
+    from .models import CorfoCodeMappingContent, CorfoCodeInstitution
+    return {
+        'contents': list(CorfoCodeMappingContent.objects.values('id', 'id_content', 'content')),
+        'institutions': list(CorfoCodeInstitution.objects.values('id', 'id_institution', 'institution')),
+    }
+
+def get_reference_data():
+    """
+        Get the current ReferenceData snapshot. It is kept in process while the
+        version saved in the shared cache does not change, and it is loaded from
+        the shared cache (or the database) only when a table was modified.
+    """
+    global _snapshot
+    version = get_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    key = REFERENCE_DATA_CACHE_KEY.format(version)
+    data = cache.get(key)
+    if data is None:
+        data = load_reference_data()
+        cache.set(key, data, settings.CORFOGENERATE_REFERENCE_DATA_TIMEOUT)
+    snapshot = ReferenceData(version, data['contents'], data['institutions'])
+    _snapshot = snapshot
+    return snapshot
+
+def invalidate_reference_data():
+    """
+        Start a new version, every process reload the snapshot on its next lookup
+    """
+    cache.set(REFERENCE_DATA_VERSION_KEY, uuid.uuid4().hex, settings.CORFOGENERATE_REFERENCE_DATA_TIMEOUT)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import hashlib
+import logging
+import os
+import pkg_resources
+import re
+
+# Installed packages (via pip)
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.template import Template
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+try:
+    PACKAGE_VERSION = pkg_resources.get_distribution('corfogeneratecode').version
+except pkg_resources.DistributionNotFound:
+    PACKAGE_VERSION = ''
+
+# Static assets that can be served by url, keyed by file name
+ASSETS = {
+    'corfogeneratecode.css': 'static/css/corfogeneratecode.css',
+    'corfogeneratecode.js': 'static/js/src/corfogeneratecode.js',
+    'corfogeneratecode_studio.js': 'static/js/src/corfogeneratecode_studio.js',
+}
+ASSET_CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+ASSET_FILENAME_RE = re.compile(r'^(?P<name>[\w-]+)\.(?P<digest>[0-9a-f]{16})(?P<ext>\.css|\.js)$')
+
+# Compiled templates shared by every block of the process, keyed by (template_path, PACKAGE_VERSION)
+_template_cache = {}
+# Decoded static assets shared by every block of the process, keyed by path: (content, digest)
+_asset_cache = {}
+
+def resource_string(path):
+    """
+        Read a resource from the package and decode it as utf8
+    """
+    data = pkg_resources.resource_string(__name__, path)
+    return data.decode("utf8")
+
+def get_template(template_path):
+    """
+        Return the compiled django Template of template_path.
+        The template is parsed only once per process unless
+        CORFOGENERATE_TEMPLATE_CACHE is disabled (development).
+    """
+    key = (template_path, PACKAGE_VERSION)
+    template = _template_cache.get(key)
+    if template is None:
+        template = Template(resource_string(template_path))
+        if settings.CORFOGENERATE_TEMPLATE_CACHE:
+            _template_cache[key] = template
+    return template
+
+def clear_template_cache():
+    """
+        Drop every compiled template, next render parse them again
+    """
+    _template_cache.clear()
+
+def get_asset(path):
+    """
+        Return (content, digest) of a static asset, read and decoded only once per process
+    """
+    asset = _asset_cache.get(path)
+    if asset is None:
+        content = resource_string(path)
+        digest = hashlib.sha256(content.encode('utf8')).hexdigest()[:16]
+        asset = (content, digest)
+        _asset_cache[path] = asset
+    return asset
+
+def clear_asset_cache():
+    """
+        Drop every loaded static asset
+    """
+    _asset_cache.clear()
+
+def get_asset_url(path):
+    """
+        Return the url of a static asset with the content hash in the file name
+    """
+    content, digest = get_asset(path)
+    name, ext = os.path.splitext(os.path.basename(path))
+    return reverse('corfogeneratecode:asset', kwargs={'filename': '{}.{}{}'.format(name, digest, ext)})
+
+def add_css(fragment, path):
+    """
+        Add css asset to fragment, by url if CORFOGENERATE_ASSET_URLS is enabled else inline
+    """
+    if settings.CORFOGENERATE_ASSET_URLS:
+        fragment.add_css_url(get_asset_url(path))
+    else:
+        fragment.add_css(get_asset(path)[0])
+
+def add_javascript(fragment, path):
+    """
+        Add javascript asset to fragment, by url if CORFOGENERATE_ASSET_URLS is enabled else inline
+    """
+    if settings.CORFOGENERATE_ASSET_URLS:
+        fragment.add_javascript_url(get_asset_url(path))
+    else:
+        fragment.add_javascript(get_asset(path)[0])
+
+def serve_asset(request, filename):
+    """
+        Serve a static asset by its hashed file name, browsers can cache it forever
+    """
+    match = ASSET_FILENAME_RE.match(filename)
+    if match is None:
+        raise Http404()
+    path = ASSETS.get(match.group('name') + match.group('ext'))
+    if path is None:
+        raise Http404()
+    content, digest = get_asset(path)
+    if digest != match.group('digest'):
+        raise Http404()
+    response = HttpResponse(content, content_type=ASSET_CONTENT_TYPES[match.group('ext')])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
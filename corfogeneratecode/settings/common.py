@@ -2,4 +2,36 @@ def plugin_settings(settings):
     settings.CORFOGENERATE_URL_TOKEN = ''
     settings.CORFOGENERATE_CLIENT_ID = ''
     settings.CORFOGENERATE_CLIENT_SECRET = ''
-    settings.CORFOGENERATE_URL_VALIDATE = ''
\ No newline at end of file
+    settings.CORFOGENERATE_URL_VALIDATE = ''
+    settings.CORFOGENERATE_TEMPLATE_CACHE = True
+    settings.CORFOGENERATE_ASSET_URLS = False
+    settings.CORFOGENERATE_GRADE_CACHE_TIMEOUT = 60 * 5
+    settings.CORFOGENERATE_GRADE_REFRESH_ON_SUBMIT = True
+    settings.CORFOGENERATE_HTTP_POOL_SIZE = 10
+    settings.CORFOGENERATE_HTTP_CONNECT_TIMEOUT = 3.05
+    settings.CORFOGENERATE_HTTP_READ_TIMEOUT = 10
+    settings.CORFOGENERATE_TOKEN_EXPIRY_MARGIN = 60
+    settings.CORFOGENERATE_TOKEN_REFRESH_BEFORE = 60 * 5
+    settings.CORFOGENERATE_METRICS_BACKEND = None
+    settings.CORFOGENERATE_METRICS_PROMETHEUS = False
+    settings.CORFOGENERATE_ASYNC_SUBMIT = False
+    settings.CORFOGENERATE_ASYNC_RESULT_TIMEOUT = 60 * 10
+    settings.CORFOGENERATE_ASYNC_PENDING_STALE = 60 * 2
+    settings.CORFOGENERATE_GRADE_CUTOFF_CACHE_TIMEOUT = 60 * 60 * 24
+    settings.CORFOGENERATE_REFERENCE_DATA_TIMEOUT = 60 * 60
+    settings.CORFOGENERATE_SUBMIT_RESULT_TIMEOUT = 10
+    settings.CORFOGENERATE_BREAKER_THRESHOLD = 5
+    settings.CORFOGENERATE_BREAKER_COOLDOWN = 60
+    settings.CORFOGENERATE_BREAKER_PROBE_TIMEOUT = 30
+    settings.CORFOGENERATE_RETRY_MAX_ATTEMPTS = 3
+    settings.CORFOGENERATE_RETRY_BACKOFF_BASE = 0.5
+    settings.CORFOGENERATE_RETRY_BACKOFF_MAX = 4
+    settings.CORFOGENERATE_RETRY_BUDGET = 15
+    settings.CORFOGENERATE_METRICS_TOKEN = ''
+    settings.CORFOGENERATE_METRICS_BACKLOG_TIMEOUT = 60
+    settings.CORFOGENERATE_EXPORT_CHUNK_SIZE = 2000
+    settings.CORFOGENERATE_ADMIN_EXACT_COUNT_LIMIT = 10000
+    settings.CORFOGENERATE_CODE_POOL_SIZE = 10000
+    settings.CORFOGENERATE_CODE_POOL_BATCH_SIZE = 1000
+    settings.CORFOGENERATE_NEGATIVE_CACHE_TIMEOUT = 60
+    settings.CORFOGENERATE_GRADE_SOURCE = 'persistent'
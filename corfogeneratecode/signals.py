@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Installed packages (via pip)
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# Edx dependencies
+from openedx.core.djangoapps.signals.signals import COURSE_GRADE_CHANGED
+from uchileedxlogin.models import EdxLoginUser
+from xmodule.modulestore.django import SignalHandler
+
+# Internal project dependencies
+from .grades import clear_cached_course_edited_on, clear_cached_course_grade, clear_cached_grade_cutoff
+from .models import CorfoCodeInstitution, CorfoCodeMappingContent
+from .negative_cache import NO_RUT, NOT_PASSED, clear_negative_results
+from .reference_data import invalidate_reference_data
+
+
+@receiver(COURSE_GRADE_CHANGED)
+def invalidate_course_grade(sender, user, course_key, **kwargs):
+    """
+        Drop cached (passed, percent) and cached "not passed" responses when the platform recompute the course grade
+    """
+    clear_cached_course_grade(user.id, course_key)
+    clear_negative_results(user.id, NOT_PASSED)
+
+
+@receiver(SignalHandler.course_published)
+def invalidate_grade_cutoff(sender, course_key, **kwargs):
+    """
+        Drop cached grade cutoff and last publish datetime when the course is published,
+        grade_cutoffs could have changed and the persisted grades are stale until recomputed
+    """
+    clear_cached_grade_cutoff(course_key)
+    clear_cached_course_edited_on(course_key)
+
+
+@receiver(post_save, sender=CorfoCodeMappingContent)
+@receiver(post_delete, sender=CorfoCodeMappingContent)
+@receiver(post_save, sender=CorfoCodeInstitution)
+@receiver(post_delete, sender=CorfoCodeInstitution)
+def invalidate_reference_data_on_change(sender, **kwargs):
+    """
+        Start a new version of the contents/institutions snapshot once the change is committed,
+        a snapshot loaded before the commit would keep the old rows under the new version
+    """
+    transaction.on_commit(invalidate_reference_data)
+
+
+@receiver(post_save, sender=EdxLoginUser)
+@receiver(post_delete, sender=EdxLoginUser)
+def invalidate_no_rut_on_change(sender, instance, **kwargs):
+    """
+        Drop cached "user without rut" responses when the rut of the user change, once the change is committed
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: clear_negative_results(user_id, NO_RUT))
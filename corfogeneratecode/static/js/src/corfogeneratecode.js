@@ -12,6 +12,53 @@ function CorfoGenerateXBlock(runtime, element) {
     var $ = window.jQuery;
     var $element = $(element);
     var handlerUrl = runtime.handlerUrl(element, 'generate_code');
+    var statusUrl = runtime.handlerUrl(element, 'generate_code_status');
+    var pollInterval = 2000;
+    var pollMaxAttempts = 30;
+
+    function showResponse(response) {
+        /* 
+            Show corfo code or error message
+        */
+        if(response.result == 'success'){
+            $element.find('#corfo_code')[0].textContent = response.code;
+            $element.find('#corfo_user_rut')[0].textContent = response.user_rut;
+            $(element).find('#corfo-get-code').hide()
+            $(element).find('#corfo_label_div').show();
+            $element.find('.corfogeneratecode_error')[0].innerHTML = '';
+        }
+        else if(response.result == 'pending'){
+            $(element).find('#corfo-get-code').hide()
+            $element.find('.corfogeneratecode_error')[0].innerHTML = 'Su código está siendo procesado, actualice la página en unos minutos.';
+        }
+        else{
+            $(element).find('#corfo-get-code').hide()
+            $element.find('.corfogeneratecode_error')[0].innerHTML = response.message;
+        }
+        $(element).find('#ui-loading-corfogeneratecode-load').hide()
+    }
+
+    function showFail() {
+        $(element).find('#ui-loading-corfogeneratecode-load').hide()
+        alert("Error inesperado ha ocurrido. Actualice la página e intente nuevamente.")
+    }
+
+    function pollStatus(attempt) {
+        /* 
+            Wait until the queued code is confirmed by corfo
+        */
+        setTimeout(function() {
+            $.post(statusUrl, JSON.stringify({})).done(function(response) {
+                if(response.result == 'pending' && attempt < pollMaxAttempts){
+                    pollStatus(attempt + 1);
+                }
+                else{
+                    showResponse(response);
+                }
+            }).fail(showFail);
+        }, pollInterval);
+    }
+
     $(element).find('#corfo-get-code').live('click', function(e) {
         /* 
             Get corfo code from api
@@ -19,21 +66,12 @@ function CorfoGenerateXBlock(runtime, element) {
         $(element).find('#ui-loading-corfogeneratecode-load').show()
         e.currentTarget.disabled = true;
         $.post(handlerUrl, JSON.stringify({})).done(function(response) {
-           if(response.result == 'success'){
-                $element.find('#corfo_code')[0].textContent = response.code;
-                $element.find('#corfo_user_rut')[0].textContent = response.user_rut;
-                $(element).find('#corfo-get-code').hide()
-                $(element).find('#corfo_label_div').show();
-                $element.find('.corfogeneratecode_error')[0].innerHTML = '';
+            if(response.result == 'pending'){
+                pollStatus(1);
             }
             else{
-                $(element).find('#corfo-get-code').hide()
-                $element.find('.corfogeneratecode_error')[0].innerHTML = response.message;
+                showResponse(response);
             }
-            $(element).find('#ui-loading-corfogeneratecode-load').hide()
-        }).fail(function() {
-            $(element).find('#ui-loading-corfogeneratecode-load').hide()
-            alert("Error inesperado ha ocurrido. Actualice la página e intente nuevamente.")
-        });
+        }).fail(showFail);
     });
 }
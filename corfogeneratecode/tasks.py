@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+# Python Standard Libraries
+import logging
+
+# Installed packages (via pip)
+from celery import shared_task
+
+# Internal project dependencies
+from .code_pool import refill_pool
+from .views import process_submission
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='corfogeneratecode.tasks.submit_code_task', ignore_result=True)
+def submit_code_task(user_id, course_id, percent, id_institution, id_content):
+    """
+        Submit a pending CorfoCodeUser to CORFO outside the LMS request
+    """
+    response = process_submission(user_id, course_id, percent, id_institution, id_content)
+    logger.info('CorfoGenerateCode - Submission task finished, user: {}, course: {}, result: {}'.format(user_id, course_id, response['result']))
+
+
+@shared_task(name='corfogeneratecode.tasks.refill_code_pool_task', ignore_result=True)
+def refill_code_pool_task():
+    """
+        Top up the code pool to CORFOGENERATE_CODE_POOL_SIZE unused codes, to run periodically
+    """
+    refill_pool()
@@ -2,27 +2,54 @@
 # -*- coding: utf-8 -*-
 # Python Standard Libraries
 from collections import namedtuple
+import datetime
+from http.client import RemoteDisconnected
 import json
+from six import StringIO
+import threading
+import time
 
 # Installed packages (via pip)
-from django.test import Client
-from django.test.utils import override_settings
+from django.template import Template
+from django.http import Http404
+from django.core.cache import cache
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 from mock import patch, Mock, MagicMock
 from uchileedxlogin.models import EdxLoginUser
+import requests
 import six
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
 
 # Edx dependencies
 from common.djangoapps.student.tests.factories import UserFactory, CourseEnrollmentFactory
+from lms.djangoapps.courseware.courses import get_course_by_id
 from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
+from lms.djangoapps.grades.models import PersistentCourseGrade
 from lms.djangoapps.grades.tests.base import GradeTestBase
 from lms.djangoapps.grades.tests.utils import mock_get_score
 from opaque_keys.edx.keys import CourseKey
 from xblock.field_data import DictFieldData
 
 # Internal project dependencies
+from . import client, metrics
+from .circuit_breaker import CircuitOpenError, CLOSED, HALF_OPEN, OPEN, corfo_breaker
+from .admin import CorfoCodeUserAdmin, EstimatedCountPaginator, export_csv
 from .corfogeneratecode import CorfoGenerateXBlock
-from .models import CorfoCodeUser, CorfoCodeMappingContent, CorfoCodeInstitution
-from .views import user_course_passed, grade_percent_scaled, generate_code, validate_data, get_grade_cutoff, get_token, validate_mooc
+from .export import export_codes
+from .grades import get_cached_course_grade, grade_percent_scaled_batch
+from .locks import cache_lock
+from .code_pool import CODE_CHARS, refill_pool
+from .models import CorfoCodePool, CorfoCodeUser, CorfoCodeMappingContent, CorfoCodeInstitution
+from .prometheus import export_metrics
+from .resources import clear_template_cache, get_asset, serve_asset
+from .reference_data import get_reference_data
+from .signals import invalidate_grade_cutoff
+from .views import user_course_passed, get_course_edited_on, grade_percent_scaled, generate_code, generate_code_corfo, validate_data, get_grade_cutoff, get_token, validate_mooc, get_credentential, TOKEN_CACHE_KEY, process_submission, get_submission_status, submit_code_once, get_corfo_user_for_update, get_submit_lock_timeout, get_token_lock_timeout, refresh_token_async, TOKEN_LOCK_KEY
 
 # Create your tests here.
 
@@ -35,6 +62,22 @@ class TestRequest(object):
     body = None
     success = None
 
+class RecordingMetricsBackend(metrics.MetricsBackend):
+    """
+        Metrics backend that keep the emitted timings, used with CORFOGENERATE_METRICS_BACKEND
+    """
+    timings = []
+
+    def timing(self, name, value, tags=None):
+        self.timings.append(name)
+
+class FailingMetricsBackend(metrics.MetricsBackend):
+    """
+        Metrics backend that always fail
+    """
+    def timing(self, name, value, tags=None):
+        raise Exception('Metrics backend down')
+
 class TestCorfoGenerateXBlock(GradeTestBase):
 
     def make_an_xblock(cls, **kw):
@@ -100,6 +143,19 @@ class TestCorfoGenerateXBlock(GradeTestBase):
             passed = self.xblock.user_course_passed()
             self.assertFalse(passed)
 
+    def test_user_course_passed_cache(self):
+        """
+            Verify user_course_passed() read the grade from cache after the first call
+        """
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            self.xblock.scope_ids.user_id = self.student.id
+            self.assertTrue(self.xblock.user_course_passed())
+        with patch('lms.djangoapps.grades.course_grade_factory.CourseGradeFactory.read') as read:
+            self.assertTrue(self.xblock.user_course_passed())
+            read.assert_not_called()
+
     def test_user_course_passed_wrong_user_id(self):
         """
             Verify method user_course_passed with wrong user_id
@@ -287,6 +343,55 @@ class TestCorfoGenerateXBlock(GradeTestBase):
             self.assertEqual(response['user_rut'], '')
             self.assertEqual(response['corfo_save'], True)
     
+    @patch('lms.djangoapps.grades.course_grade_factory.CourseGradeFactory.read')
+    def test_student_view_confirmed_skip_grade(self, read):
+        """
+            Verify student_view dont compute the grade when the user code is confirmed
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200, content='testtest')
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH', corfo_save=True)
+        self.xblock.scope_ids.user_id = self.student.id
+        self.xblock.id_content = 200
+        with patch.object(CorfoGenerateXBlock, 'user_course_passed') as passed:
+            response = self.xblock.get_context()
+            student_view = self.xblock.student_view()
+        passed.assert_not_called()
+        read.assert_not_called()
+        self.assertEqual(response['passed'], True)
+        self.assertEqual(response['corfo_save'], True)
+        self.assertIn('U1CODASDFGH', student_view.content)
+
+    @patch('lms.djangoapps.grades.course_grade_factory.CourseGradeFactory.read')
+    def test_student_view_not_confirmed_read_grade(self, read):
+        """
+            Verify student_view compute the grade when the user code is not confirmed
+        """
+        read.return_value = Mock(passed=True, percent=0.75)
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200, content='testtest')
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH', corfo_save=False)
+        self.xblock.scope_ids.user_id = self.student.id
+        self.xblock.id_content = 200
+        response = self.xblock.get_context()
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(response['passed'], True)
+        self.assertEqual(response['corfo_save'], False)
+
+    @patch('corfogeneratecode.corfogeneratecode.CorfoGenerateXBlock.user_course_passed')
+    def test_student_view_num_queries(self, passed):
+        """
+            Verify student_view load CorfoCodeUser, EdxLoginUser and CorfoCodeMappingContent in one query
+        """
+        passed.return_value = True
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200, content='testtest')
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH', corfo_save=True)
+        self.xblock.scope_ids.user_id = self.student.id
+        self.xblock.id_content = 200
+        with self.assertNumQueries(1):
+            student_view = self.xblock.student_view()
+        self.assertIn('U1CODASDFGH', student_view.content)
+        self.assertIn('9472337K', student_view.content)
+
     def test_CorfoCodeMappingContent_str(self):
         """
             Test str function on model CorfoCodeMappingContent
@@ -308,7 +413,7 @@ class TestCorfoGenerateXBlock(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_block_generate_code(self, post):
         """
             Verify generate_code() is working
@@ -360,7 +465,7 @@ class TestCorfoGenerateXBlock(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_block_generate_code_with_passport(self, post):
         """
             Verify generate_code() is working whern user have passport
@@ -412,7 +517,7 @@ class TestCorfoGenerateXBlock(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_block_generate_code_no_passport(self, post):
         """
             Verify generate_code() is working
@@ -450,9 +555,9 @@ class TestCorfoGenerateXBlock(GradeTestBase):
             response = self.xblock.generate_code(request)
             data = json.loads(response._app_iter[0].decode())
             self.assertEqual(data['result'], 'error')
-            corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content__id_content=self.xblock.id_content)
+            self.assertEqual(data['status'], 2)
             self.assertTrue('code' not in data)
-            self.assertFalse(corfouser.corfo_save)
+            self.assertFalse(CorfoCodeUser.objects.filter(user=self.student, mapping_content__id_content=self.xblock.id_content).exists())
 
     def test_block_generate_code_wrong_user_id(self):
         """
@@ -486,6 +591,65 @@ class TestCorfoGenerateXBlock(GradeTestBase):
         student_view_html = student_view.content
         self.assertIn('class="corfogeneratecode_block"', student_view_html)
 
+    def test_render_template_cache(self):
+        """
+            Check if render_template parse each template only once
+        """
+        clear_template_cache()
+        with patch('corfogeneratecode.resources.Template', wraps=Template) as mock_template:
+            first_html = self.xblock.author_view().content
+            second_html = self.xblock.author_view().content
+            self.assertEqual(mock_template.call_count, 1)
+            self.assertEqual(first_html, second_html)
+
+    @override_settings(CORFOGENERATE_TEMPLATE_CACHE=False)
+    def test_render_template_cache_disabled(self):
+        """
+            Check if render_template parse the template on every render when cache is disabled
+        """
+        clear_template_cache()
+        with patch('corfogeneratecode.resources.Template', wraps=Template) as mock_template:
+            self.xblock.author_view()
+            self.xblock.author_view()
+            self.assertEqual(mock_template.call_count, 2)
+
+    def test_student_view_inline_assets(self):
+        """
+            Check if css and js are inlined in student_view by default
+        """
+        self.xblock.scope_ids.user_id = self.student.id
+        student_view = self.xblock.student_view()
+        kinds = [resource.kind for resource in student_view.resources]
+        self.assertEqual(kinds, ['text', 'text'])
+        self.assertEqual(student_view.resources[0].data, get_asset('static/css/corfogeneratecode.css')[0])
+
+    @override_settings(CORFOGENERATE_ASSET_URLS=True)
+    def test_student_view_asset_urls(self):
+        """
+            Check if css and js are added by hashed url in student_view when CORFOGENERATE_ASSET_URLS is enabled
+        """
+        self.xblock.scope_ids.user_id = self.student.id
+        student_view = self.xblock.student_view()
+        kinds = [resource.kind for resource in student_view.resources]
+        self.assertEqual(kinds, ['url', 'url'])
+        content, digest = get_asset('static/css/corfogeneratecode.css')
+        self.assertIn('corfogeneratecode.{}.css'.format(digest), student_view.resources[0].data)
+
+    def test_serve_asset(self):
+        """
+            Check if serve_asset return the asset only with the right content hash
+        """
+        content, digest = get_asset('static/js/src/corfogeneratecode.js')
+        request = RequestFactory().get('/')
+        response = serve_asset(request, 'corfogeneratecode.{}.js'.format(digest))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode('utf8'), content)
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.assertRaises(Http404):
+            serve_asset(request, 'corfogeneratecode.0000000000000000.js')
+        with self.assertRaises(Http404):
+            serve_asset(request, 'settings.{}.js'.format(digest))
+
     def test_studio_view_render(self,):
         """
             Check if xblock studio template loaded correctly
@@ -618,6 +782,83 @@ class TestCorfoGenerateView(GradeTestBase):
             self.assertIsNone(percent)
             self.assertIsNone(passed)
 
+    @override_settings(CORFOGENERATE_GRADE_SOURCE='live')
+    def test_user_course_passed_cache(self):
+        """
+            Verify user_course_passed read the grade from cache unless force is True
+        """
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            passed, percent = user_course_passed(self.student, self.course.id)
+        self.assertEqual(get_cached_course_grade(self.student.id, self.course.id), (passed, percent))
+        with patch('corfogeneratecode.views.CourseGradeFactory') as mock_factory_class:
+            mock_factory_instance = mock_factory_class.return_value
+            mock_factory_instance.read.return_value = None
+            self.assertEqual(user_course_passed(self.student, self.course.id), (passed, percent))
+            mock_factory_instance.read.assert_not_called()
+            self.assertEqual(user_course_passed(self.student, self.course.id, force=True), (None, None))
+            mock_factory_instance.read.assert_called_once()
+
+    def test_user_course_passed_persistent_grade(self):
+        """
+            Verify user_course_passed read the persisted grade of the current course version with one query, without CourseGradeFactory
+        """
+        course_edited_on = get_course_edited_on(self.course.id)
+        PersistentCourseGrade.objects.update_or_create(
+            user_id=self.student.id,
+            course_id=self.course.id,
+            defaults={'percent_grade': 0.75, 'letter_grade': 'Pass', 'course_version': '', 'course_edited_timestamp': course_edited_on, 'grading_policy_hash': 'hash'})
+        with patch('corfogeneratecode.views.CourseGradeFactory') as mock_factory_class:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(user_course_passed(self.student, self.course.id), (True, 0.75))
+            self.assertEqual(len(queries), 1)
+            mock_factory_class.return_value.read.assert_not_called()
+        self.assertEqual(get_cached_course_grade(self.student.id, self.course.id), (True, 0.75))
+
+    def test_user_course_passed_persistent_grade_stale(self):
+        """
+            Verify user_course_passed compute the grade when the persisted grade was computed before the last publish of the course
+        """
+        PersistentCourseGrade.objects.update_or_create(
+            user_id=self.student.id,
+            course_id=self.course.id,
+            defaults={'percent_grade': 0.75, 'letter_grade': 'Pass', 'course_version': '', 'course_edited_timestamp': get_course_edited_on(self.course.id) - datetime.timedelta(days=1), 'grading_policy_hash': 'hash'})
+        with patch('corfogeneratecode.views.CourseGradeFactory') as mock_factory_class:
+            mock_factory_class.return_value.read.return_value = namedtuple('CourseGrade', ['passed', 'percent'])(False, 0.25)
+            self.assertEqual(user_course_passed(self.student, self.course.id), (False, 0.25))
+            mock_factory_class.return_value.read.assert_called_once()
+
+    def test_user_course_passed_persistent_grade_force(self):
+        """
+            Verify user_course_passed with force compute the grade even if the persisted grade is current
+        """
+        PersistentCourseGrade.objects.update_or_create(
+            user_id=self.student.id,
+            course_id=self.course.id,
+            defaults={'percent_grade': 0.75, 'letter_grade': 'Pass', 'course_version': '', 'course_edited_timestamp': get_course_edited_on(self.course.id), 'grading_policy_hash': 'hash'})
+        with patch('corfogeneratecode.views.CourseGradeFactory') as mock_factory_class:
+            mock_factory_class.return_value.read.return_value = namedtuple('CourseGrade', ['passed', 'percent'])(False, 0.25)
+            self.assertEqual(user_course_passed(self.student, self.course.id, force=True), (False, 0.25))
+            mock_factory_class.return_value.read.assert_called_once()
+
+    def test_user_course_passed_cache_grade_changed(self):
+        """
+            Verify cached grade is dropped when the course grade change
+        """
+        with mock_get_score(1, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(1, 4):
+            passed, percent = user_course_passed(self.student, self.course.id)
+            self.assertFalse(passed)
+        self.assertIsNotNone(get_cached_course_grade(self.student.id, self.course.id))
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        self.assertIsNone(get_cached_course_grade(self.student.id, self.course.id))
+        with mock_get_score(3, 4):
+            passed, percent = user_course_passed(self.student, self.course.id)
+            self.assertTrue(passed)
+
     def test_round_half_up(self):
         """
             Verify method grade_percent_scaled() work correctly
@@ -626,6 +867,25 @@ class TestCorfoGenerateView(GradeTestBase):
         for i in range(101):
             self.assertEqual(grade_percent_scaled(i/100,0.6), grades[i])
 
+    def test_grade_percent_scaled_batch(self):
+        """
+            Verify grade_percent_scaled_batch() is exactly grade_percent_scaled() on a dense grid
+        """
+        percents = [i / 2000 for i in range(2001)]
+        for cutoff in [i / 100 for i in range(5, 96)]:
+            scaled = grade_percent_scaled_batch(percents, cutoff)
+            expected = [grade_percent_scaled(percent, cutoff) for percent in percents]
+            self.assertEqual(scaled.tolist(), expected)
+
+    def test_grade_percent_scaled_batch_round_half_up(self):
+        """
+            Verify grade_percent_scaled_batch() with the grades of test_round_half_up
+        """
+        percents = [i / 100 for i in range(101)]
+        scaled = grade_percent_scaled_batch(percents, 0.6)
+        self.assertEqual(scaled.tolist(), [grade_percent_scaled(percent, 0.6) for percent in percents])
+        self.assertEqual(float(grade_percent_scaled_batch(0.55, 0.6)), grade_percent_scaled(0.55, 0.6))
+
     def test_get_grade_cutoff(self):
         """
             Verify method get_grade_cutoff() with wrong course_key
@@ -634,6 +894,43 @@ class TestCorfoGenerateView(GradeTestBase):
         result = get_grade_cutoff(course_key)
         self.assertIsNone(result)
 
+    def test_get_grade_cutoff_cache(self):
+        """
+            Verify method get_grade_cutoff() load the course only once until it is published
+        """
+        with patch('corfogeneratecode.views.get_course_by_id', wraps=get_course_by_id) as mock_get_course:
+            grade_cutoff = get_grade_cutoff(self.course.id)
+            self.assertEqual(get_grade_cutoff(self.course.id), grade_cutoff)
+            self.assertEqual(get_grade_cutoff(self.course.id), grade_cutoff)
+            self.assertEqual(mock_get_course.call_count, 1)
+            invalidate_grade_cutoff(None, course_key=self.course.id)
+            self.assertEqual(get_grade_cutoff(self.course.id), grade_cutoff)
+            self.assertEqual(mock_get_course.call_count, 2)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    def test_validate_data_reference_data(self):
+        """
+            Verify method validate_data read contents and institutions from the snapshot without queries
+        """
+        CorfoCodeInstitution.objects.create(id_institution=3090, institution='NVIDIA')
+        self.assertTrue(validate_data(self.student, str(self.course.id), 3090, 200))
+        with self.assertNumQueries(0):
+            self.assertTrue(validate_data(self.student, str(self.course.id), 3090, 200))
+            self.assertFalse(validate_data(self.student, str(self.course.id), 3091, 200))
+            self.assertFalse(validate_data(self.student, str(self.course.id), 3093, 201))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            CorfoCodeMappingContent.objects.create(id_content=201, content='testtest2')
+            # the snapshot is kept until the change is committed
+            self.assertFalse(validate_data(self.student, str(self.course.id), 3093, 201))
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(validate_data(self.student, str(self.course.id), 3093, 201))
+        with self.captureOnCommitCallbacks(execute=True):
+            CorfoCodeInstitution.objects.get(id_institution=3090).delete()
+        self.assertFalse(validate_data(self.student, str(self.course.id), 3090, 200))
+
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
@@ -665,7 +962,7 @@ class TestCorfoGenerateView(GradeTestBase):
         """
             test views.generate_code(request) without user data
         """
-
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
         data = generate_code(self.student, str(self.course.id), 3093, 200)
         self.assertEqual(data['result'], 'error')
         self.assertEqual(data['status'], 0)
@@ -692,11 +989,12 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_fail_token(self, post):
         """
             test views.generate_code(request) when get toket failed
         """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
         id_content = 200
         post.side_effect = [namedtuple("Request", ["status_code"])(400)]
         with mock_get_score(3, 4):
@@ -714,7 +1012,7 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_user_no_rut(self, post):
         """
             test views.generate_code(request) when user dont have edxloginuser.rut
@@ -733,16 +1031,14 @@ class TestCorfoGenerateView(GradeTestBase):
             data = generate_code(self.student, str(self.course.id), 3093, id_content)
             self.assertEqual(data['result'], 'error')
             self.assertEqual(data['status'], 2)
-            mapp_content = CorfoCodeMappingContent.objects.get(id_content=id_content)
-            corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content=mapp_content)
-            self.assertFalse(corfouser.corfo_save)
-            self.assertTrue(corfouser.code != '')
+            self.assertFalse(CorfoCodeUser.objects.filter(user=self.student, mapping_content__id_content=id_content).exists())
+            post.assert_not_called()
 
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_user_no_passport(self, post):
         """
             test views.generate_code(request) when user dont have rut or passport
@@ -762,16 +1058,14 @@ class TestCorfoGenerateView(GradeTestBase):
             data = generate_code(self.student, str(self.course.id), 3093, id_content)
             self.assertEqual(data['result'], 'error')
             self.assertEqual(data['status'], 2)
-            mapp_content = CorfoCodeMappingContent.objects.get(id_content=id_content)
-            corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content=mapp_content)
-            self.assertFalse(corfouser.corfo_save)
-            self.assertTrue(corfouser.code != '')
+            self.assertFalse(CorfoCodeUser.objects.filter(user=self.student, mapping_content__id_content=id_content).exists())
+            post.assert_not_called()
 
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_user_wrong_rut(self, post):
         """
             test views.generate_code(request) when user have wrong edxloginuser.rut
@@ -791,16 +1085,14 @@ class TestCorfoGenerateView(GradeTestBase):
             data = generate_code(self.student, str(self.course.id), 3093, id_content)
             self.assertEqual(data['result'], 'error')
             self.assertEqual(data['status'], 2)
-            mapp_content = CorfoCodeMappingContent.objects.get(id_content=id_content)
-            corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content=mapp_content)
-            self.assertFalse(corfouser.corfo_save)
-            self.assertTrue(corfouser.code != '')
+            self.assertFalse(CorfoCodeUser.objects.filter(user=self.student, mapping_content__id_content=id_content).exists())
+            post.assert_not_called()
 
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_validate_fail(self, post):
         """
             test views.generate_code(request) when post validate failed
@@ -838,7 +1130,7 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_validate_wrong_data(self, post):
         """
             test views.generate_code(request) when post validate with wrong data
@@ -965,6 +1257,7 @@ class TestCorfoGenerateView(GradeTestBase):
         """
             test views.generate_code(request) when get user_course_passed failed
         """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
         passed.return_value = None, None
         id_content = 200
 
@@ -977,7 +1270,7 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
     @patch("corfogeneratecode.views.get_grade_cutoff")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_grade_cutoff_none(self, post, grade_cutoff):
         """
             test views.generate_code(request) when get_grade_cutoff failed
@@ -1001,16 +1294,14 @@ class TestCorfoGenerateView(GradeTestBase):
             data = generate_code(self.student, str(self.course.id), 3093, id_content)
             self.assertEqual(data['result'], 'error')
             self.assertEqual(data['status'], 7)
-            mapp_content = CorfoCodeMappingContent.objects.get(id_content=id_content)
-            corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content=mapp_content)
-            self.assertFalse(corfouser.corfo_save)
-            self.assertTrue(corfouser.code != '')
+            self.assertFalse(CorfoCodeUser.objects.filter(user=self.student, mapping_content__id_content=id_content).exists())
+            post.assert_not_called()
 
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_success(self, post):
         """
             test views.generate_code(request) success process
@@ -1047,7 +1338,7 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_success_with_passport(self, post):
         """
             test views.generate_code(request) success process
@@ -1084,7 +1375,7 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_generate_code_request_validate_no_id_institution(self, post):
         """
             test views.generate_code(request) when post validate without id_institution
@@ -1116,7 +1407,879 @@ class TestCorfoGenerateView(GradeTestBase):
     @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
     @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
-    @patch('requests.post')
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_ASYNC_SUBMIT=True)
+    @patch('corfogeneratecode.tasks.submit_code_task.delay')
+    @patch('requests.Session.post')
+    def test_generate_code_async(self, post, delay):
+        """
+            test views.generate_code(request) queue the submission when CORFOGENERATE_ASYNC_SUBMIT is enabled
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        id_content = 200
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post.side_effect = [namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data) ,namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, id_content)
+            self.assertEqual(data, {'result': 'pending'})
+            data = generate_code(self.student, str(self.course.id), 3093, id_content)
+            self.assertEqual(data, {'result': 'pending'})
+        post.assert_not_called()
+        delay.assert_called_once()
+        corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content__id_content=id_content)
+        self.assertFalse(corfouser.corfo_save)
+        self.assertTrue(corfouser.code != '')
+        self.assertEqual(get_submission_status(self.student, id_content), {'result': 'pending'})
+
+        response = process_submission(*delay.call_args[0])
+        self.assertEqual(response['result'], 'success')
+        data = get_submission_status(self.student, id_content)
+        self.assertEqual(data['result'], 'success')
+        self.assertEqual(data['code'], corfouser.code)
+        self.assertEqual(data['user_rut'], '9472337K')
+        corfouser.refresh_from_db()
+        self.assertTrue(corfouser.corfo_save)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_ASYNC_SUBMIT=True)
+    @patch('corfogeneratecode.tasks.submit_code_task.delay')
+    @patch('requests.Session.post')
+    def test_generate_code_async_fail_token(self, post, delay):
+        """
+            test views.get_submission_status return the error of the queued submission
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        id_content = 200
+        post.side_effect = [namedtuple("Request", ["status_code"])(400)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, id_content)
+        self.assertEqual(data, {'result': 'pending'})
+        process_submission(*delay.call_args[0])
+        data = get_submission_status(self.student, id_content)
+        self.assertEqual(data['result'], 'error')
+        self.assertEqual(data['status'], 1)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_ASYNC_SUBMIT=True)
+    @override_settings(CORFOGENERATE_ASYNC_PENDING_STALE=60)
+    @patch('corfogeneratecode.tasks.submit_code_task.delay')
+    def test_generate_code_async_stale_pending(self, delay):
+        """
+            test views.generate_code(request) queue the submission again when its task did not write a result
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        id_content = 200
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            self.assertEqual(generate_code(self.student, str(self.course.id), 3093, id_content), {'result': 'pending'})
+            self.assertEqual(generate_code(self.student, str(self.course.id), 3093, id_content), {'result': 'pending'})
+            self.assertEqual(delay.call_count, 1)
+            with patch('corfogeneratecode.views.time.time', return_value=time.time() + 61):
+                self.assertEqual(generate_code(self.student, str(self.course.id), 3093, id_content), {'result': 'pending'})
+            self.assertEqual(delay.call_count, 2)
+        self.assertEqual(get_submission_status(self.student, id_content), {'result': 'pending'})
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_ASYNC_SUBMIT=True)
+    @patch('corfogeneratecode.views.submit_code', side_effect=Exception('Unexpected error'))
+    @patch('corfogeneratecode.tasks.submit_code_task.delay')
+    def test_generate_code_async_task_exception(self, delay, submit):
+        """
+            test views.process_submission save an error result when the submission raise
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        id_content = 200
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            self.assertEqual(generate_code(self.student, str(self.course.id), 3093, id_content), {'result': 'pending'})
+        with self.assertRaises(Exception):
+            process_submission(*delay.call_args[0])
+        data = get_submission_status(self.student, id_content)
+        self.assertEqual(data['result'], 'error')
+        self.assertEqual(data['status'], 3)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch('requests.Session.post')
+    def test_corfo_resubmit(self, post):
+        """
+            test corfo_resubmit command submit the codes with corfo_save=False
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        corfouser = CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH')
+        CorfoCodeUser.objects.create(user=self.user_unenroll, mapping_content=mapp_content, code='U2CODASDFGH')
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post.side_effect = [namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data) ,namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            out = StringIO()
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-content', '200', '--id-institution', '3093', stdout=out)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args[1]['data']['CodigoCertificacion'], 'U1CODASDFGH')
+        self.assertIn('Rows: 1, skipped: 0, submitted: 1, success: 1, error: 0', out.getvalue())
+        corfouser.refresh_from_db()
+        self.assertTrue(corfouser.corfo_save)
+
+    @patch('requests.Session.post')
+    def test_corfo_resubmit_dry_run(self, post):
+        """
+            test corfo_resubmit command with --dry-run dont call CORFO
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        corfouser = CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH')
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            out = StringIO()
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-content', '200', '--id-institution', '3093', '--dry-run', stdout=out)
+        post.assert_not_called()
+        self.assertIn('Would resubmit user: student2, code: U1CODASDFGH', out.getvalue())
+        corfouser.refresh_from_db()
+        self.assertFalse(corfouser.corfo_save)
+
+    def test_corfo_resubmit_id_institution_required(self):
+        """
+            test corfo_resubmit command refuse to run without a known --id-institution
+        """
+        with self.assertRaises(CommandError):
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-content', '200', '--dry-run', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-content', '200', '--id-institution', '3090', '--dry-run', stdout=StringIO())
+
+    def test_corfo_resubmit_id_content_required(self):
+        """
+            test corfo_resubmit command refuse to run without a known --id-content, the codes of other courses would be sent with the grade of --course
+        """
+        with self.assertRaises(CommandError):
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-institution', '3093', '--dry-run', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('corfo_resubmit', '--course', str(self.course.id), '--id-content', '201', '--id-institution', '3093', '--dry-run', stdout=StringIO())
+
+    def test_refill_pool(self):
+        """
+            test code_pool.refill_pool add unique codes until the pool has size unused codes
+        """
+        self.assertEqual(refill_pool(50, batch_size=20), 50)
+        CorfoCodePool.objects.filter(pk__in=CorfoCodePool.objects.values_list('pk', flat=True)[:10]).update(used=True)
+        self.assertEqual(refill_pool(50, batch_size=20), 10)
+        codes = list(CorfoCodePool.objects.values_list('code', flat=True))
+        self.assertEqual(len(codes), 60)
+        self.assertEqual(len(set(codes)), 60)
+        self.assertTrue(all(len(code) == 8 and set(code) <= set(CODE_CHARS) for code in codes))
+        out = StringIO()
+        call_command('corfo_code_pool', '--size', '55', stdout=out)
+        self.assertIn('Added: 5, available: 55', out.getvalue())
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch('requests.Session.post')
+    def test_generate_code_claim_pool_code(self, post):
+        """
+            test views.generate_code(request) use a code of the pool and mark it as used
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        refill_pool(2)
+        first = CorfoCodePool.objects.order_by('pk').first()
+        post.side_effect = [namedtuple("Request", ["status_code", "json", "text"])(400, lambda:{}, 'error')]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 1)
+        corfouser = CorfoCodeUser.objects.get(user=self.student, mapping_content__id_content=200)
+        self.assertEqual(corfouser.code, 'U{}COD{}'.format(self.student.id, first.code))
+        first.refresh_from_db()
+        self.assertTrue(first.used)
+        self.assertEqual(CorfoCodePool.objects.filter(used=False).count(), 1)
+
+    def test_generate_code_corfo_empty_pool(self):
+        """
+            test views.generate_code_corfo fall back to a random code when the pool is empty
+        """
+        with self.assertLogs('corfogeneratecode.code_pool', level='WARNING'):
+            code = generate_code_corfo(self.student.id)
+        self.assertTrue(code.startswith('U{}COD'.format(self.student.id)))
+        self.assertEqual(len(code), len('U{}COD'.format(self.student.id)) + 8)
+
+    def test_corfo_export(self):
+        """
+            test corfo_export command write one CSV row per CorfoCodeUser with the formatted rut
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH', corfo_save=True)
+        CorfoCodeUser.objects.create(user=UserFactory(username='norut'), mapping_content=mapp_content, code='U2CODASDFGH')
+        out = StringIO()
+        # One query per chunk of one row and the last empty one
+        with self.assertNumQueries(3):
+            call_command('corfo_export', '--id-content', '200', '--chunk-size', '1', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'username,email,rut,id_content,content,code,corfo_save,created_at')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('student2,{},9472337K,200,{},U1CODASDFGH,True,'.format(self.student.email, mapp_content.content)))
+        self.assertTrue(lines[2].startswith('norut,'))
+        self.assertIn(',,200,', lines[2])
+
+        out = StringIO()
+        call_command('corfo_export', '--pending', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('U2CODASDFGH', lines[1])
+
+    def test_export_codes_view(self):
+        """
+            test export.export_codes stream the CSV only to staff users
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH', corfo_save=True)
+        request = RequestFactory().get('/corfogeneratecode/export', {'id_content': '200', 'corfo_save': '1'})
+        request.user = self.student
+        self.assertEqual(export_codes(request).status_code, 403)
+        request.user = UserFactory(is_staff=True)
+        response = export_codes(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="corfo_codes.csv"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('U1CODASDFGH', lines[1])
+
+        request = RequestFactory().get('/corfogeneratecode/export', {'since': 'yesterday'})
+        request.user = UserFactory(is_staff=True)
+        self.assertEqual(export_codes(request).status_code, 400)
+
+    def test_admin_changelist_num_queries(self):
+        """
+            test CorfoCodeUserAdmin changelist load user and mapping_content in the same query
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        request = RequestFactory().get('/admin/corfogeneratecode/corfocodeuser/')
+        request.user = UserFactory(is_staff=True, is_superuser=True)
+        model_admin = CorfoCodeUserAdmin(CorfoCodeUser, admin.site)
+        num_queries = []
+        for _ in range(2):
+            for _ in range(3):
+                CorfoCodeUser.objects.create(user=UserFactory(), mapping_content=mapp_content, code='U2CODASDFGH')
+            with CaptureQueriesContext(connection) as queries:
+                changelist = model_admin.get_changelist_instance(request)
+                rows = [(str(row.user), str(row.mapping_content)) for row in changelist.result_list]
+            num_queries.append(len(queries))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(num_queries[0], num_queries[1])
+
+    @override_settings(CORFOGENERATE_ADMIN_EXACT_COUNT_LIMIT=1000)
+    @patch('corfogeneratecode.admin.get_estimated_count', return_value=123456)
+    def test_admin_estimated_count(self, estimated_count):
+        """
+            test EstimatedCountPaginator use the estimated count only for big unfiltered tables
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH')
+        self.assertEqual(EstimatedCountPaginator(CorfoCodeUser.objects.all(), 100).count, 123456)
+        self.assertEqual(EstimatedCountPaginator(CorfoCodeUser.objects.filter(code__startswith='U1'), 100).count, 1)
+        estimated_count.return_value = 10
+        self.assertEqual(EstimatedCountPaginator(CorfoCodeUser.objects.all(), 100).count, 1)
+
+    def test_admin_export_csv(self):
+        """
+            test CorfoCodeUserAdmin export_csv action stream the selected rows
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH')
+        CorfoCodeUser.objects.create(user=UserFactory(), mapping_content=mapp_content, code='U2CODASDFGH')
+        request = RequestFactory().post('/admin/corfogeneratecode/corfocodeuser/')
+        response = export_csv(None, request, CorfoCodeUser.objects.filter(code='U2CODASDFGH'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('U2CODASDFGH', lines[1])
+        self.assertIn(export_csv, CorfoCodeUserAdmin.actions)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch("corfogeneratecode.views.user_course_passed")
+    @patch('requests.Session.post')
+    def test_generate_code_num_queries(self, post, passed):
+        """
+            test views.generate_code(request) load CorfoCodeUser with edxloginuser in one query, dont lock it when it has a code and save only the changed fields
+        """
+        passed.return_value = True, 0.75
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        corfouser = CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content, code='U1CODASDFGH')
+        cache.set(TOKEN_CACHE_KEY, {'access_token': 'token', 'refresh_at': time.time() + 600}, 600)
+        get_grade_cutoff(self.course.id)
+        get_reference_data()
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        # SELECT CorfoCodeUser JOIN EdxLoginUser, UPDATE corfo_save
+        with self.assertNumQueries(2):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data, {'result': 'success', 'code': 'U1CODASDFGH', 'user_rut': '9472337K'})
+        corfouser.refresh_from_db()
+        self.assertTrue(corfouser.corfo_save)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch("corfogeneratecode.views.get_grade_cutoff")
+    @patch("corfogeneratecode.views.user_course_passed")
+    @patch('requests.Session.post')
+    def test_generate_code_cheap_checks_first(self, post, passed, grade_cutoff):
+        """
+            test views.generate_code(request) reject missing rut and grade cutoff without reading the grade or calling CORFO
+        """
+        passed.return_value = True, 0.75
+        grade_cutoff.return_value = 0.6
+        data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 2)
+        grade_cutoff.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        grade_cutoff.return_value = None
+        data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 7)
+        passed.assert_not_called()
+        post.assert_not_called()
+        self.assertFalse(CorfoCodeUser.objects.filter(user=self.student).exists())
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch("corfogeneratecode.views.get_credentential", return_value=None)
+    def test_generate_code_negative_cache_no_rut(self, credentential):
+        """
+            test views.generate_code(request) return the cached status 2 until the EdxLoginUser of the user is saved
+        """
+        get_reference_data()
+        data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 2)
+        with self.assertNumQueries(0):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            EdxLoginUser.objects.create(user=self.student, run='009472337K')
+            # the cached response is kept until the change is committed
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+            self.assertEqual(data['status'], 2)
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 1)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch("corfogeneratecode.views.get_credentential", return_value=None)
+    def test_generate_code_negative_cache_not_passed(self, credential):
+        """
+            test views.generate_code(request) return the cached status 0 without reading the grade until the course grade change
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        with mock_get_score(1, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(1, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 0)
+        with patch("corfogeneratecode.views.user_course_passed") as passed:
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 0)
+        passed.assert_not_called()
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['status'], 1)
+
+    def test_get_corfo_user_for_update_create_race(self):
+        """
+            test views.get_corfo_user_for_update return the row created by a concurrent request when its own create fail
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        def concurrent_create(**kwargs):
+            CorfoCodeUser(**kwargs).save()
+            raise IntegrityError('Duplicate entry')
+        with patch.object(CorfoCodeUser.objects, 'create', side_effect=concurrent_create) as create:
+            with transaction.atomic():
+                corfouser = get_corfo_user_for_update(self.student, mapp_content.id)
+        create.assert_called_once_with(user=self.student, mapping_content_id=mapp_content.id)
+        self.assertEqual(CorfoCodeUser.objects.filter(user=self.student, mapping_content=mapp_content).count(), 1)
+        self.assertEqual(corfouser.pk, CorfoCodeUser.objects.get(user=self.student, mapping_content=mapp_content).pk)
+        self.assertEqual(corfouser.code, '')
+
+    def test_get_corfo_user_for_update_existing_row(self):
+        """
+            test views.get_corfo_user_for_update lock the existing row without trying to create it
+        """
+        mapp_content = CorfoCodeMappingContent.objects.get(id_content=200)
+        existing = CorfoCodeUser.objects.create(user=self.student, mapping_content=mapp_content)
+        with patch.object(CorfoCodeUser.objects, 'create') as create:
+            with transaction.atomic():
+                corfouser = get_corfo_user_for_update(self.student, mapp_content.id)
+        create.assert_not_called()
+        self.assertEqual(corfouser.pk, existing.pk)
+
+    @patch('requests.Session.post')
+    def test_submit_code_once_concurrent(self, post):
+        """
+            test views.submit_code_once send only one request to CORFO when the user click many times at once
+        """
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        def slow_post(*args, **kwargs):
+            time.sleep(0.3)
+            return namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)
+        post.side_effect = slow_post
+        cache.set(TOKEN_CACHE_KEY, {'access_token': 'token', 'refresh_at': time.time() + 600}, 600)
+        get_grade_cutoff(self.course.id)
+        corfouser = Mock(code='U1CODASDFGH', corfo_save=False)
+        responses = []
+        def click():
+            responses.append(submit_code_once(self.student, corfouser, self.course.id, 0.75, 3093, 200, '9472337K'))
+        threads = [threading.Thread(target=click) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(responses, [{'result': 'success', 'code': 'U1CODASDFGH', 'user_rut': '9472337K'}] * 5)
+        corfouser.save.assert_called_once_with(update_fields=['corfo_save', 'created_at'])
+
+    @patch('requests.Session.post')
+    def test_submit_code_once_error_not_reused(self, post):
+        """
+            test views.submit_code_once call CORFO again when the user click after a failed submission
+        """
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [
+            namedtuple("Request", ["status_code", "json", "text"])(400, lambda:{}, 'error'),
+            namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        cache.set(TOKEN_CACHE_KEY, {'access_token': 'token', 'refresh_at': time.time() + 600}, 600)
+        get_grade_cutoff(self.course.id)
+        corfouser = Mock(code='U1CODASDFGH', corfo_save=False)
+        response = submit_code_once(self.student, corfouser, self.course.id, 0.75, 3093, 200, '9472337K')
+        self.assertEqual(response['status'], 3)
+        response = submit_code_once(self.student, corfouser, self.course.id, 0.75, 3093, 200, '9472337K')
+        self.assertEqual(response, {'result': 'success', 'code': 'U1CODASDFGH', 'user_rut': '9472337K'})
+        self.assertEqual(post.call_count, 2)
+
+    @override_settings(CORFOGENERATE_RETRY_BUDGET=15)
+    @override_settings(CORFOGENERATE_HTTP_READ_TIMEOUT=10)
+    def test_submit_lock_timeout(self):
+        """
+            test views.get_submit_lock_timeout cover the token and validate_mooc calls with retries, twice
+        """
+        self.assertEqual(client.get_max_request_time(), 25)
+        self.assertEqual(get_token_lock_timeout(), 25)
+        self.assertEqual(get_submit_lock_timeout(), 2 * (25 + 25))
+
+    @patch('corfogeneratecode.views.refresh_token')
+    def test_refresh_token_async_lock(self, refresh_token):
+        """
+            test views.refresh_token_async dont release the token lock taken by other worker after its own expired
+        """
+        started = threading.Event()
+        release = threading.Event()
+        def slow_refresh():
+            started.set()
+            release.wait(5)
+        refresh_token.side_effect = slow_refresh
+        refresh_token_async()
+        self.assertTrue(started.wait(5))
+        refresh_token_async()
+        self.assertEqual(refresh_token.call_count, 1)
+        # The lock expired and other worker took it
+        cache.set(TOKEN_LOCK_KEY, 'other-worker', 60)
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'corfogeneratecode-token-refresh':
+                thread.join(5)
+        self.assertEqual(cache.get(TOKEN_LOCK_KEY), 'other-worker')
+
+    def test_cache_lock_expired(self):
+        """
+            test locks.cache_lock dont release a lock taken by other worker after its own expired
+        """
+        with cache_lock('corfogeneratecode-test-lock', 60) as acquired:
+            self.assertTrue(acquired)
+            with cache_lock('corfogeneratecode-test-lock', 60) as acquired_again:
+                self.assertFalse(acquired_again)
+            self.assertIsNotNone(cache.get('corfogeneratecode-test-lock'))
+            cache.set('corfogeneratecode-test-lock', 'other-worker', 60)
+        self.assertEqual(cache.get('corfogeneratecode-test-lock'), 'other-worker')
+        with cache_lock('corfogeneratecode-test-lock-2', 60) as acquired:
+            self.assertTrue(acquired)
+        self.assertIsNone(cache.get('corfogeneratecode-test-lock-2'))
+
+    @override_settings(CORFOGENERATE_BREAKER_THRESHOLD=3)
+    @override_settings(CORFOGENERATE_BREAKER_COOLDOWN=60)
+    @patch('requests.Session.post')
+    def test_circuit_breaker(self, post):
+        """
+            test client.post fail fast after consecutive failures and close again after a successful probe
+        """
+        post.side_effect = Exception("Connection error")
+        for _ in range(3):
+            self.assertEqual(get_token(), {'result': 'error'})
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(corfo_breaker.get_state(), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            client.post('aaaaa')
+        self.assertEqual(get_token(), {'result': 'error'})
+        self.assertEqual(post.call_count, 3)
+
+        cache.set(corfo_breaker.opened_key, time.time() - 61, None)
+        self.assertEqual(corfo_breaker.get_state(), HALF_OPEN)
+        post.side_effect = None
+        post.return_value = namedtuple("Request", ["status_code", "json"])(200, lambda:{"access_token": "token", "expires_in": 3599})
+        self.assertEqual(get_token()['result'], 'success')
+        self.assertEqual(post.call_count, 4)
+        self.assertEqual(corfo_breaker.get_state(), CLOSED)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch('requests.Session.post')
+    def test_generate_code_circuit_breaker_open(self, post):
+        """
+            test views.generate_code(request) return status 3 without calling CORFO when the circuit breaker is open
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        corfo_breaker.open()
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['result'], 'error')
+        self.assertEqual(data['status'], 3)
+        post.assert_not_called()
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=0)
+    @patch('requests.Session.post')
+    def test_validate_mooc_retry_transient(self, post):
+        """
+            test views.validate_mooc retry errors before the request is sent and 503 and return the next response
+        """
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [
+            requests.exceptions.ConnectTimeout("Connect timeout"),
+            requests.ConnectionError(MaxRetryError(None, 'aaaaa', NewConnectionError(None, 'Failed to establish a new connection'))),
+            namedtuple("Request", ["status_code", "json", "text"])(503, lambda:{}, 'error'),
+            namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with override_settings(CORFOGENERATE_RETRY_MAX_ATTEMPTS=4):
+            result = validate_mooc('token', 'ABC123', 90, 1, '12345678-9', 'test@example.com', 3093)
+        self.assertEqual(result['result'], 'success')
+        self.assertEqual(post.call_count, 4)
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=0)
+    @patch('requests.Session.post')
+    def test_validate_mooc_no_retry_connection_aborted(self, post):
+        """
+            test views.validate_mooc dont retry a connection closed after the request was sent
+        """
+        post.side_effect = [requests.ConnectionError(ProtocolError('Connection aborted.', RemoteDisconnected('Remote end closed connection without response')))]
+        result = validate_mooc('token', 'ABC123', 90, 1, '12345678-9', 'test@example.com', 3093)
+        self.assertEqual(result['result'], 'error')
+        self.assertEqual(post.call_count, 1)
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=0)
+    @override_settings(CORFOGENERATE_RETRY_BUDGET=4)
+    @override_settings(CORFOGENERATE_HTTP_CONNECT_TIMEOUT=3.05)
+    @override_settings(CORFOGENERATE_HTTP_READ_TIMEOUT=10)
+    @patch('requests.Session.post')
+    def test_get_token_retry_timeout_within_budget(self, post):
+        """
+            test views.get_token cut the timeouts of each attempt to the seconds left in CORFOGENERATE_RETRY_BUDGET
+        """
+        post.side_effect = requests.ReadTimeout("Read timeout")
+        self.assertEqual(get_token(), {'result': 'error'})
+        for call in post.call_args_list:
+            connect_timeout, read_timeout = call[1]['timeout']
+            self.assertLessEqual(connect_timeout, 3.05)
+            self.assertLessEqual(read_timeout, 4)
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=0)
+    @patch('requests.Session.post')
+    def test_validate_mooc_no_retry_not_idempotent(self, post):
+        """
+            test views.validate_mooc dont retry read timeouts, 504 or 400, CORFO could have processed them
+        """
+        post.side_effect = [requests.ReadTimeout("Read timeout")]
+        result = validate_mooc('token', 'ABC123', 90, 1, '12345678-9', 'test@example.com', 3093)
+        self.assertEqual(result['result'], 'error')
+        post.side_effect = [namedtuple("Request", ["status_code", "json", "text"])(504, lambda:{}, 'error')]
+        result = validate_mooc('token', 'ABC123', 90, 1, '12345678-9', 'test@example.com', 3093)
+        self.assertEqual(result['result'], 'error')
+        post.side_effect = [namedtuple("Request", ["status_code", "json", "text"])(400, lambda:{}, 'error')]
+        result = validate_mooc('token', 'ABC123', 90, 1, '12345678-9', 'test@example.com', 3093)
+        self.assertEqual(result['result'], 'error')
+        self.assertEqual(post.call_count, 3)
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=0)
+    @override_settings(CORFOGENERATE_RETRY_MAX_ATTEMPTS=2)
+    @patch('requests.Session.post')
+    def test_get_token_retry_max_attempts(self, post):
+        """
+            test views.get_token retry timeouts (idempotent) only CORFOGENERATE_RETRY_MAX_ATTEMPTS times
+        """
+        post.side_effect = requests.ReadTimeout("Read timeout")
+        self.assertEqual(get_token(), {'result': 'error'})
+        self.assertEqual(post.call_count, 2)
+
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_BASE=10)
+    @override_settings(CORFOGENERATE_RETRY_BACKOFF_MAX=10)
+    @override_settings(CORFOGENERATE_RETRY_BUDGET=1)
+    @patch('corfogeneratecode.client.random.uniform', return_value=5)
+    @patch('requests.Session.post')
+    def test_get_token_retry_budget(self, post, uniform):
+        """
+            test views.get_token dont retry when the backoff exceeds CORFOGENERATE_RETRY_BUDGET
+        """
+        post.side_effect = requests.ConnectionError("Connection error")
+        self.assertEqual(get_token(), {'result': 'error'})
+        self.assertEqual(post.call_count, 1)
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @patch('requests.Session.post')
+    def test_generate_code_refresh_token_unauthorized(self, post):
+        """
+            test views.generate_code(request) refresh the token once and retry when CORFO return 401
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        cache.set(TOKEN_CACHE_KEY, {'access_token': 'old-token', 'refresh_at': time.time() + 600}, 600)
+        resp_data = {
+            "access_token": "new-token",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [
+            namedtuple("Request", ["status_code", "json", "text"])(401, lambda:{}, 'Unauthorized'),
+            namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data),
+            namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['result'], 'success')
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(post.call_args_list[2][1]['headers']['Authorization'], 'Bearer new-token')
+        self.assertEqual(cache.get(TOKEN_CACHE_KEY)['access_token'], 'new-token')
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_METRICS_BACKEND='corfogeneratecode.tests.RecordingMetricsBackend')
+    @patch('requests.Session.post')
+    def test_generate_code_stage_timings(self, post):
+        """
+            test views.generate_code(request) emit a timing for each stage and log one timing line
+        """
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        RecordingMetricsBackend.timings = []
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data), namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            with self.assertLogs('corfogeneratecode.metrics', level='INFO') as cm:
+                data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['result'], 'success')
+        for stage in ['validate', 'grade', 'corfo_user', 'token', 'grade_cutoff', 'validate_mooc', 'total']:
+            self.assertIn('corfogeneratecode.generate_code.{}'.format(stage), RecordingMetricsBackend.timings)
+        self.assertEqual(len(cm.output), 1)
+        self.assertIn('CorfoGenerateCode - timing request=generate_code total=', cm.output[0])
+        self.assertIn(' validate_mooc=', cm.output[0])
+        self.assertIn(' result=success', cm.output[0])
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
+    @override_settings(CORFOGENERATE_METRICS_BACKEND='corfogeneratecode.tests.RecordingMetricsBackend')
+    @override_settings(CORFOGENERATE_METRICS_PROMETHEUS=True)
+    @patch('requests.Session.post')
+    def test_export_metrics(self, post):
+        """
+            test prometheus.export_metrics return the counters and stage timings of generate_code and the cached backlog,
+            recorded together with CORFOGENERATE_METRICS_BACKEND
+        """
+        RecordingMetricsBackend.timings = []
+        EdxLoginUser.objects.create(user=self.student, run='009472337K')
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post_data = {
+                'Data': 0,
+                'Message': None,
+                'Status': 0,
+                'Success': True
+            }
+        post.side_effect = [namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data), namedtuple("Request", ["status_code", "json"])(200, lambda:post_data)]
+        with mock_get_score(3, 4):
+            self.grade_factory.update(self.student, self.course, force_update_subsections=True)
+        with mock_get_score(3, 4):
+            data = generate_code(self.student, str(self.course.id), 3093, 200)
+        self.assertEqual(data['result'], 'success')
+        CorfoCodeUser.objects.create(user=UserFactory(), mapping_content=CorfoCodeMappingContent.objects.get(id_content=200), code='U2CODASDFGH')
+
+        request = RequestFactory().get('/corfogeneratecode/metrics')
+        request.user = self.student
+        self.assertEqual(export_metrics(request).status_code, 403)
+        request.user = UserFactory(is_staff=True)
+        response = export_metrics(request)
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertIn('corfogeneratecode_generate_code_total{status="success"} 1', lines)
+        self.assertIn('corfogeneratecode_generate_code_total{status="2"} 0', lines)
+        self.assertIn('corfogeneratecode_token_miss_total 1', lines)
+        self.assertIn('corfogeneratecode_http_responses_total{code="2xx"} 2', lines)
+        self.assertIn('corfogeneratecode_codes_generated_total 1', lines)
+        self.assertIn('corfogeneratecode_codes_confirmed_total 1', lines)
+        self.assertIn('corfogeneratecode_pending_codes 1', lines)
+        self.assertIn('corfogeneratecode_breaker_state{breaker="corfo"} 0', lines)
+        self.assertIn('# TYPE corfogeneratecode_stage_duration_seconds histogram', lines)
+        self.assertIn('corfogeneratecode_stage_duration_seconds_bucket{request="generate_code",stage="total",le="+Inf"} 1', lines)
+        self.assertIn('corfogeneratecode_stage_duration_seconds_count{request="generate_code",stage="validate_mooc"} 1', lines)
+        self.assertIn('corfogeneratecode.generate_code.total', RecordingMetricsBackend.timings)
+
+        # backlog is read from cache until CORFOGENERATE_METRICS_BACKLOG_TIMEOUT
+        CorfoCodeUser.objects.filter(code='U2CODASDFGH').update(corfo_save=True)
+        with self.assertNumQueries(0):
+            lines = export_metrics(request).content.decode().splitlines()
+        self.assertIn('corfogeneratecode_pending_codes 1', lines)
+
+    @override_settings(CORFOGENERATE_METRICS_PROMETHEUS=True)
+    @override_settings(CORFOGENERATE_METRICS_TOKEN='secret')
+    def test_export_metrics_token(self):
+        """
+            test prometheus.export_metrics with CORFOGENERATE_METRICS_TOKEN allow only the bearer token
+        """
+        request = RequestFactory().get('/corfogeneratecode/metrics')
+        request.user = UserFactory(is_staff=True)
+        self.assertEqual(export_metrics(request).status_code, 403)
+        request = RequestFactory().get('/corfogeneratecode/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        response = export_metrics(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE corfogeneratecode_pending_codes gauge', response.content.decode())
+
+    def test_export_metrics_disabled(self):
+        """
+            test prometheus.export_metrics is not found when CORFOGENERATE_METRICS_PROMETHEUS is disabled
+        """
+        request = RequestFactory().get('/corfogeneratecode/metrics')
+        request.user = UserFactory(is_staff=True)
+        with self.assertRaises(Http404):
+            export_metrics(request)
+
+    @override_settings(CORFOGENERATE_METRICS_BACKEND=['corfogeneratecode.tests.FailingMetricsBackend', 'corfogeneratecode.tests.RecordingMetricsBackend'])
+    def test_composite_metrics_backend(self):
+        """
+            test metrics.get_backend send the metrics to every backend of the list even if one of them fail
+        """
+        RecordingMetricsBackend.timings = []
+        self.assertIsInstance(metrics.get_backend(), metrics.CompositeMetricsBackend)
+        metrics.timing('corfogeneratecode.generate_code.total', 10)
+        self.assertEqual(RecordingMetricsBackend.timings, ['corfogeneratecode.generate_code.total'])
+
+    @override_settings(CORFOGENERATE_URL_TOKEN="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_ID="aaaaa")
+    @override_settings(CORFOGENERATE_CLIENT_SECRET="aaaaa")
+    @patch('requests.Session.post')
     def test_get_token_post_connection_error(self, post):
         """
             test views.get_token when post return exception connection error
@@ -1127,8 +2290,86 @@ class TestCorfoGenerateView(GradeTestBase):
         self.assertEqual(result, {'result': 'error'})
         self.assertIn('CorfoGenerateCode - Error to get token, exception:', cm.output[0])
         
+    @override_settings(CORFOGENERATE_HTTP_CONNECT_TIMEOUT=2)
+    @override_settings(CORFOGENERATE_HTTP_READ_TIMEOUT=5)
+    @patch('requests.Session.post')
+    def test_get_token_pooled_session(self, post):
+        """
+            test views.get_token use the per-process session with explicit timeouts
+        """
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post.return_value = namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data)
+        self.assertEqual(get_token()['result'], 'success')
+        self.assertEqual(get_token()['result'], 'success')
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args[1]['timeout'], (2, 5))
+        self.assertIs(client.get_session(), client.get_session())
+
+    @override_settings(CORFOGENERATE_TOKEN_EXPIRY_MARGIN=60)
+    @override_settings(CORFOGENERATE_TOKEN_REFRESH_BEFORE=300)
+    @patch('corfogeneratecode.metrics.increment')
+    @patch('requests.Session.post')
+    def test_get_credentential_expires_in(self, post, increment):
+        """
+            test views.get_credentential cache the token using expires_in and count hit/miss/refresh
+        """
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        post.return_value = namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data)
+        before = time.time()
+        self.assertEqual(get_credentential(), resp_data['access_token'])
+        self.assertEqual(get_credentential(), resp_data['access_token'])
+        self.assertEqual(post.call_count, 1)
+        data = cache.get(TOKEN_CACHE_KEY)
+        self.assertGreaterEqual(data['refresh_at'], before + 3599 - 60 - 300)
+        self.assertLessEqual(data['refresh_at'], time.time() + 3599 - 60 - 300)
+        metric_names = [call[0][0] for call in increment.call_args_list]
+        self.assertEqual(metric_names, ['corfogeneratecode.token.miss', 'corfogeneratecode.token.refresh', 'corfogeneratecode.token.hit'])
+
+    @patch('corfogeneratecode.views.refresh_token_async')
+    def test_get_credentential_early_refresh(self, refresh_token_async):
+        """
+            test views.get_credentential return the cached token and refresh it in background when it is about to expire
+        """
+        cache.set(TOKEN_CACHE_KEY, {'access_token': 'old-token', 'refresh_at': time.time() - 1}, 60)
+        self.assertEqual(get_credentential(), 'old-token')
+        refresh_token_async.assert_called_once_with()
+
+    @patch('requests.Session.post')
+    def test_get_credentential_single_flight(self, post):
+        """
+            test views.get_credentential only ask one token when many workers miss the cache at the same time
+        """
+        resp_data = {
+            "access_token": "IE742SAsEMadiliCt1w582TMnvj98aDyS6L7BXSFP84vto914p77nX",
+            "token_type": "Bearer",
+            "expires_in": 3599,
+            "scope": "resource.READ"
+        }
+        def slow_post(*args, **kwargs):
+            time.sleep(0.3)
+            return namedtuple("Request", ["status_code", "json"])(200, lambda:resp_data)
+        post.side_effect = slow_post
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(get_credentential())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(tokens, [resp_data['access_token']] * 5)
+
     @override_settings(CORFOGENERATE_URL_VALIDATE="aaaaa")
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_validate_mooc_error_has_ocurred(self, post):
         """
             test views.validate_mooc when post return exception An error has occurred.
@@ -0,0 +1,12 @@
+from django.urls import re_path
+
+from .export import export_codes
+from .prometheus import export_metrics
+from .resources import serve_asset
+
+
+urlpatterns = [
+    re_path(r'^assets/(?P<filename>[\w.-]+)$', serve_asset, name='asset'),
+    re_path(r'^metrics$', export_metrics, name='metrics'),
+    re_path(r'^export$', export_codes, name='export'),
+]
@@ -1,16 +1,15 @@
 #!/usr/bin/env python
 # -- coding: utf-8 --
 # Python Standard Libraries
-from datetime import datetime
-from decimal import Decimal, ROUND_HALF_UP
 import logging
+import threading
+import time
 
 # Installed packages (via pip)
 from django.conf import settings
-from django.contrib.auth.base_user import BaseUserManager
 from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
 from django.http import Http404
-import requests
 
 # Edx dependencies
 from lms.djangoapps.courseware.courses import get_course_by_id
@@ -19,66 +18,293 @@ from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import CourseKey
 
 # Internal project dependencies
-from .models import CorfoCodeUser, CorfoCodeMappingContent, CorfoCodeInstitution
+from . import client, metrics
+from .circuit_breaker import corfo_breaker
+from .code_pool import claim_code, random_code
+from .grades import get_cached_course_edited_on, get_cached_course_grade, get_cached_grade_cutoff, grade_percent_scaled, read_persistent_grade, set_cached_course_edited_on, set_cached_course_grade, set_cached_grade_cutoff
+from .locks import acquire_lock, cache_lock, release_lock
+from .negative_cache import get_negative_result, set_negative_result
+from .reference_data import get_reference_data
+from .models import CorfoCodeUser
 
 logger = logging.getLogger(__name__)
 
+TOKEN_CACHE_KEY = 'corfogeneratecode-access-token'
+TOKEN_LOCK_KEY = 'corfogeneratecode-token-lock'
+TOKEN_LOCK_POLL = 0.1
+TOKEN_DEFAULT_EXPIRES_IN = 60*30
+SUBMIT_LOCK_KEY = 'corfogeneratecode-submit-lock-{}-{}'
+SUBMIT_RESULT_KEY = 'corfogeneratecode-submit-result-{}-{}'
+SUBMIT_LOCK_POLL = 0.1
+# validate_mooc calls of submit_code, a second one if the token is rejected
+SUBMIT_CORFO_CALLS = 2
+SUBMISSION_CACHE_KEY = 'corfogeneratecode-submission-{}-{}'
+SUBMISSION_PENDING = {'result': 'pending'}
+
+@metrics.timed_request('generate_code')
 def generate_code(user, course_id, id_institution, id_content):
+    """
+       Checks that need neither grades nor network go first (rut, grade cutoff),
+       the grade is read and CORFO is called only for requests that can succeed
+    """
     if validate_data(user, course_id, id_institution, id_content):
         course_key = CourseKey.from_string(course_id)
-        passed, percent = user_course_passed(user, course_key)
         id_content = int(id_content)
         id_institution = int(id_institution)
+        response = get_negative_result(user.id, id_content)
+        if response is not None:
+            return response
+        mapp_content = get_reference_data().get_content(id_content)
+        corfouser = get_corfo_user(user, mapp_content['id'])
+        if corfouser is not None:
+            user_rut = get_user_rut(corfouser)
+            if corfouser.corfo_save and corfouser.code != '':
+                logger.info('CorfoGenerateCode - User already have code, user: {}, course: {}'.format(user, course_id))
+                return {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
+        else:
+            user_rut = get_rut(user)
+        if user_rut is None:
+            logger.error('CorfoGenerateCode - User dont have edxloginuser.run, user: {}, course: {}'.format(user, course_id))
+            response = {'result':'error', 'status': 2, 'message': 'Usuario no tiene su Rut configurado, contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a> para más información'}
+            set_negative_result(user.id, id_content, response)
+            return response
+        if get_grade_cutoff(course_key) is None:
+            return {'result':'error', 'status': 7, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a><a href="/contact_form" target="_blank">presionando aquí</a>.'}
+
+        passed, percent = user_course_passed(user, course_key, force=settings.CORFOGENERATE_GRADE_REFRESH_ON_SUBMIT)
         if passed is None:
             return {'result':'error', 'status': 6, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
         if passed is False:
             logger.error('CorfoGenerateCode - User dont passed course, user: {}, course: {}'.format(user, course_id))
-            return {'result':'error', 'status': 0, 'message': 'Usuario no ha aprobado el curso todavía.'}
-        mapp_content = CorfoCodeMappingContent.objects.get(id_content=id_content)
-        corfouser, created = CorfoCodeUser.objects.get_or_create(user=user, mapping_content=mapp_content)
-        user_rut = get_user_rut(corfouser)
-        if corfouser.corfo_save and corfouser.code != '':
-            logger.info('CorfoGenerateCode - User already have code, user: {}, course: {}'.format(user, course_id))
-            return {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
-
-        if corfouser.code == '':
-            corfouser.code = generate_code_corfo(user.id)
-            corfouser.corfo_save = False
-            corfouser.created_at = datetime.now()
-            corfouser.save()
-        token = get_credentential()
-        if token is None:
-            logger.error('CorfoGenerateCode - Error to get token, user: {}, course: {}'.format(user, course_id))
-            return {'result':'error', 'status': 1, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+            response = {'result':'error', 'status': 0, 'message': 'Usuario no ha aprobado el curso todavía.'}
+            set_negative_result(user.id, id_content, response)
+            return response
 
-        if user_rut is None:
-            logger.error('CorfoGenerateCode - User dont have edxloginuser.run, user: {}, course: {}'.format(user, course_id))
-            return {'result':'error', 'status': 2, 'message': 'Usuario no tiene su Rut configurado, contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a> para más información'}
+        if corfouser is None or corfouser.code == '':
+            with transaction.atomic():
+                corfouser = get_corfo_user_for_update(user, mapp_content['id'])
+                if corfouser.code == '':
+                    corfouser.code = generate_code_corfo(user.id)
+                    corfouser.corfo_save = False
+                    corfouser.save(update_fields=['code', 'corfo_save', 'created_at'])
+                    metrics.increment('corfogeneratecode.code.generated')
+            if corfouser.corfo_save:
+                logger.info('CorfoGenerateCode - User already have code, user: {}, course: {}'.format(user, course_id))
+                return {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
 
-        grade_cutoff = get_grade_cutoff(course_key)
-        if grade_cutoff is None:
-            return {'result':'error', 'status': 7, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a><a href="/contact_form" target="_blank">presionando aquí</a>.'}
+        if settings.CORFOGENERATE_ASYNC_SUBMIT:
+            return enqueue_submission(user, course_key, percent, id_institution, id_content)
+        return submit_code_once(user, corfouser, course_key, percent, id_institution, id_content, user_rut)
+    return {'result':'error', 'status': 5, 'message': 'Usuario no ha iniciado sesión o error en parámetros, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+
+def submit_code(user, corfouser, course_key, percent, id_institution, id_content, user_rut):
+    """
+       Send the code of corfouser to CORFO and mark it as saved
+    """
+    if corfo_breaker.is_open():
+        logger.error('CorfoGenerateCode - Circuit breaker open, skip CORFO call, user: {}, course: {}'.format(user, str(course_key)))
+        return {'result':'error', 'status': 3, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+    if user_rut is None:
+        logger.error('CorfoGenerateCode - User dont have edxloginuser.run, user: {}, course: {}'.format(user, str(course_key)))
+        return {'result':'error', 'status': 2, 'message': 'Usuario no tiene su Rut configurado, contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a> para más información'}
+
+    grade_cutoff = get_grade_cutoff(course_key)
+    if grade_cutoff is None:
+        return {'result':'error', 'status': 7, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a><a href="/contact_form" target="_blank">presionando aquí</a>.'}
+
+    token = get_credentential()
+    if token is None:
+        logger.error('CorfoGenerateCode - Error to get token, user: {}, course: {}'.format(user, str(course_key)))
+        return {'result':'error', 'status': 1, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+
+    score = grade_percent_scaled(percent, grade_cutoff)
+    response = validate_mooc(token, corfouser.code, str(score), id_content, user_rut, user.email, id_institution)
+    if response['result'] == 'unauthorized':
+        logger.info('CorfoGenerateCode - Token rejected, refresh it and retry, user: {}, course: {}'.format(user, str(course_key)))
+        invalidate_token(token)
+        token = get_credentential()
+        if token is not None:
+            response = validate_mooc(token, corfouser.code, str(score), id_content, user_rut, user.email, id_institution)
+    if response['result'] in ('error', 'unauthorized'):
+        return {'result':'error', 'status': 3, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+    if response['result'] == 'error_success':
+        logger.error('CorfoGenerateCode - Error validate api in status or data, user: {}, course: {}, response: {}'.format(user, str(course_key), response))
+        return {'result':'error', 'status': 4, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
 
-        score = grade_percent_scaled(percent, grade_cutoff)
-        response = validate_mooc(token, corfouser.code, str(score), id_content, user_rut, user.email, id_institution)
-        if response['result'] == 'error':
+    corfouser.corfo_save = True
+    corfouser.save(update_fields=['corfo_save', 'created_at'])
+    metrics.increment('corfogeneratecode.code.confirmed')
+    return {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
+
+def submit_code_once(user, corfouser, course_key, percent, id_institution, id_content, user_rut):
+    """
+       Call submit_code only once for concurrent requests of the same user and id_content,
+       the other requests wait for the first one and return its response
+    """
+    lock_key = SUBMIT_LOCK_KEY.format(user.id, id_content)
+    result_key = SUBMIT_RESULT_KEY.format(user.id, id_content)
+    lock_timeout = get_submit_lock_timeout()
+    started = time.time()
+    deadline = started + lock_timeout
+    while True:
+        with cache_lock(lock_key, lock_timeout) as acquired:
+            if acquired:
+                response = get_submit_result(result_key, started)
+                if response is None:
+                    response = submit_code(user, corfouser, course_key, percent, id_institution, id_content, user_rut)
+                    cache.set(result_key, {'response': response, 'finished_at': time.time()}, settings.CORFOGENERATE_SUBMIT_RESULT_TIMEOUT)
+                return response
+        response = get_submit_result(result_key, started)
+        if response is not None:
+            logger.info('CorfoGenerateCode - Reuse response of concurrent request, user: {}, course: {}'.format(user, str(course_key)))
+            return response
+        if time.time() >= deadline:
+            logger.error('CorfoGenerateCode - Timeout waiting concurrent request, user: {}, course: {}'.format(user, str(course_key)))
             return {'result':'error', 'status': 3, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
-        if response['result'] == 'error_success':
-            logger.error('CorfoGenerateCode - Error validate api in status or data, user: {}, course: {}, response: {}'.format(user, course_id, response))
-            return {'result':'error', 'status': 4, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
-
-        corfouser.corfo_save = True
-        corfouser.created_at = datetime.now()
-        corfouser.save()
-        return {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
-    return {'result':'error', 'status': 5, 'message': 'Usuario no ha iniciado sesión o error en parámetros, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+        time.sleep(SUBMIT_LOCK_POLL)
+
+def get_submit_result(result_key, started):
+    """
+       Get the response saved by a concurrent submit_code_once. An error is only
+       reused by requests that were already waiting when it finished, a later
+       click calls CORFO again
+    """
+    result = cache.get(result_key)
+    if result is None:
+        return None
+    if result['response']['result'] == 'success' or result['finished_at'] >= started:
+        return result['response']
+    return None
+
+def get_submit_lock_timeout():
+    """
+       Worst case seconds of submit_code, get_credentential and validate_mooc
+       with their retries and timeouts, twice if the token is rejected
+    """
+    request_time = client.get_max_request_time()
+    return SUBMIT_CORFO_CALLS * (get_token_lock_timeout() + request_time)
+
+def get_token_lock_timeout():
+    """
+       Worst case seconds of a token refresh, get_token with its retries and timeouts
+    """
+    return client.get_max_request_time()
+
+@metrics.timed('corfo_user')
+def get_corfo_user(user, mapping_content_id):
+    """
+       Get the CorfoCodeUser row of user with user.edxloginuser in one query, None if it does not exist
+    """
+    return CorfoCodeUser.objects.select_related('user__edxloginuser').filter(user=user, mapping_content_id=mapping_content_id).first()
+
+@metrics.timed('corfo_user_lock')
+def get_corfo_user_for_update(user, mapping_content_id):
+    """
+       Get and lock the CorfoCodeUser row of user with user.edxloginuser,
+       create it if it does not exist. Must be called inside transaction.atomic()
+    """
+    if connection.features.has_select_for_update_of:
+        queryset = CorfoCodeUser.objects.select_for_update(of=('self',))
+    else:
+        queryset = CorfoCodeUser.objects.select_for_update()
+    queryset = queryset.select_related('user__edxloginuser')
+    # The row is created before the locking read, a SELECT ... FOR UPDATE of a missing
+    # row takes a gap lock in InnoDB and two concurrent first clicks would deadlock on the INSERT
+    pk = CorfoCodeUser.objects.filter(user=user, mapping_content_id=mapping_content_id).values_list('pk', flat=True).first()
+    if pk is None:
+        try:
+            with transaction.atomic():
+                pk = CorfoCodeUser.objects.create(user=user, mapping_content_id=mapping_content_id).pk
+        except IntegrityError:
+            # Created by a concurrent request, the row exists now and the locking read waits for its lock
+            return queryset.get(user=user, mapping_content_id=mapping_content_id)
+    return queryset.get(pk=pk)
+
+def submission_cache_key(user_id, id_content):
+    return SUBMISSION_CACHE_KEY.format(user_id, id_content)
+
+def enqueue_submission(user, course_key, percent, id_institution, id_content):
+    """
+       Queue the CORFO submission of the pending code in celery, the result is saved in cache
+       and read by get_submission_status. A submission pending for more than
+       CORFOGENERATE_ASYNC_PENDING_STALE seconds is queued again, its task could have been lost
+    """
+    from .tasks import submit_code_task
+    key = submission_cache_key(user.id, id_content)
+    submission = cache.get(key)
+    if is_pending(submission) and time.time() - submission.get('enqueued_at', 0) < settings.CORFOGENERATE_ASYNC_PENDING_STALE:
+        return dict(SUBMISSION_PENDING)
+    if is_pending(submission):
+        logger.warning('CorfoGenerateCode - Stale pending submission, queue it again, user: {}, course: {}'.format(user, str(course_key)))
+    cache.set(key, dict(SUBMISSION_PENDING, enqueued_at=time.time()), settings.CORFOGENERATE_ASYNC_RESULT_TIMEOUT)
+    submit_code_task.delay(user.id, str(course_key), percent, id_institution, id_content)
+    return dict(SUBMISSION_PENDING)
+
+def is_pending(submission):
+    return submission is not None and submission['result'] == SUBMISSION_PENDING['result']
+
+def process_submission(user_id, course_id, percent, id_institution, id_content):
+    """
+       Submit the pending code of user to CORFO (celery task) and save the response in cache,
+       an error response if the submission raise so the pending state does not outlive the task
+    """
+    response = {'result':'error', 'status': 3, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+    try:
+        try:
+            corfouser = CorfoCodeUser.objects.select_related('user__edxloginuser').get(user__id=user_id, mapping_content__id_content=id_content)
+        except CorfoCodeUser.DoesNotExist:
+            logger.error('CorfoGenerateCode - CorfoCodeUser.DoesNotExist to submit, user: {}, course: {}, id_content: {}'.format(user_id, course_id, id_content))
+            response = {'result':'error', 'status': 6, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+        else:
+            user_rut = get_user_rut(corfouser)
+            if corfouser.corfo_save and corfouser.code != '':
+                response = {'result':'success', 'code': corfouser.code, 'user_rut': user_rut}
+            else:
+                # A submission queued again while the first task runs waits for it instead of calling CORFO twice
+                response = submit_code_once(corfouser.user, corfouser, CourseKey.from_string(course_id), percent, id_institution, id_content, user_rut)
+    finally:
+        cache.set(submission_cache_key(user_id, id_content), response, settings.CORFOGENERATE_ASYNC_RESULT_TIMEOUT)
+    return response
+
+@metrics.timed_request('generate_code_status')
+def get_submission_status(user, id_content):
+    """
+       Get the result of the queued CORFO submission of user
+    """
+    try:
+        corfouser = CorfoCodeUser.objects.select_related('user__edxloginuser').get(user=user, mapping_content__id_content=int(id_content))
+    except (ValueError, CorfoCodeUser.DoesNotExist):
+        return {'result':'error', 'status': 5, 'message': 'Usuario no ha iniciado sesión o error en parámetros, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+    if corfouser.corfo_save and corfouser.code != '':
+        return {'result':'success', 'code': corfouser.code, 'user_rut': get_user_rut(corfouser)}
+    response = cache.get(submission_cache_key(user.id, id_content))
+    if response is None:
+        return {'result':'error', 'status': 6, 'message': 'Un error inesperado ha ocurrido, actualice la página e intente nuevamente, si el problema persiste contáctese con mesa de ayuda <a href="/contact_form" target="_blank">presionando aquí</a>.'}
+    if is_pending(response):
+        return dict(SUBMISSION_PENDING)
+    return response
 
 def get_user_rut(corfouser):
     """
         Get user.rut from EdxLoginUser model
     """
+    return get_rut(corfouser.user)
+
+def get_rut(user):
+    """
+        Get the rut of user from EdxLoginUser model, None if it does not exist or it is invalid
+    """
+    try:
+        aux_run = user.edxloginuser.run
+    except AttributeError as e:
+        return None
+    return format_rut(aux_run)
+
+def format_rut(aux_run):
+    """
+        Rut without leading zeros as CORFO expects it, passports as they are, None if it is invalid
+    """
     try:
-        aux_run = corfouser.user.edxloginuser.run
         if aux_run[0] == 'P':
             return aux_run
         elif aux_run[0].isalpha():
@@ -86,9 +312,10 @@ def get_user_rut(corfouser):
         else:
             run = str(int(aux_run[:-1])) + aux_run[-1]
             return run
-    except (AttributeError, ValueError) as e:
+    except (IndexError, TypeError, ValueError) as e:
         return None
 
+@metrics.timed('validate')
 def validate_data(user, course_id, id_institution, id_content):
     """
         Validate data
@@ -108,10 +335,12 @@ def validate_data(user, course_id, id_institution, id_content):
         logger.error('CorfoGenerateCode - id_content is not Integer, user: {}, course: {}, id_content: {}'.format(user, course_id, id_content))
         return False
 
+    reference_data = get_reference_data()
     try:
-        if int(id_institution) != 3093:
-            institution = CorfoCodeInstitution.objects.get(id_institution=int(id_institution))
-    except (ValueError, CorfoCodeInstitution.DoesNotExist ) as e:
+        institution_exists = int(id_institution) == 3093 or reference_data.get_institution(int(id_institution)) is not None
+    except ValueError:
+        institution_exists = False
+    if not institution_exists:
         logger.error('CorfoGenerateCode - id_institution is not Integer or dont exists, user: {}, course: {}, id_institution: {}'.format(user, course_id, id_institution))
         return False
 
@@ -120,9 +349,7 @@ def validate_data(user, course_id, id_institution, id_content):
     except InvalidKeyError:
         logger.error('CorfoGenerateCode - InvalidKeyError course_id, user: {}, course: {}'.format(user, course_id))
         return False
-    try:
-        corfomapping = CorfoCodeMappingContent.objects.get(id_content=int(id_content))
-    except CorfoCodeMappingContent.DoesNotExist:
+    if reference_data.get_content(int(id_content)) is None:
         logger.error('CorfoGenerateCode - CorfoCodeMappingContent.DoesNotExist user: {}, course: {}, id_content: {}'.format(user, course_id, id_content))
         return False
     return True
@@ -139,14 +366,28 @@ def is_empty(attr):
     """
     return attr == "" or attr == 0 or attr is None
 
-def user_course_passed(user, course_key):
+@metrics.timed('grade')
+def user_course_passed(user, course_key, force=False):
     """
-       Get if user passed course with percert
+       Get if user passed course with percert, from cache or from the persisted grade if it was
+       computed for the current version of the course, else computed by CourseGradeFactory.
+       With force it is always computed
     """
+    if not force:
+        grade = get_cached_course_grade(user.id, course_key)
+        if grade is not None:
+            return grade
+        grade = read_persistent_grade(user.id, course_key, get_course_edited_on(course_key))
+        if grade is not None:
+            metrics.increment('corfogeneratecode.grade.read', tags={'source': 'persistent'})
+            set_cached_course_grade(user.id, course_key, *grade)
+            return grade
+    metrics.increment('corfogeneratecode.grade.read', tags={'source': 'live'})
     response = CourseGradeFactory().read(user, course_key=course_key)
     if response is None:
         logger.error('CorfoGenerateCode - Error to get CourseGradeFactory().read(...), user: {}, course: {}'.format(user, str(course_key)))
         return None, None
+    set_cached_course_grade(user.id, course_key, response.passed, response.percent)
     return response.passed, response.percent
 
 def get_token():
@@ -163,8 +404,9 @@ def get_token():
         "grant_type": 'client_credentials'
     }
     try:
-        r = requests.post(
+        r = client.post_with_retry(
             settings.CORFOGENERATE_URL_TOKEN,
+            idempotent=True,
             data=body,
             headers=headers, verify=False)
         if r.status_code == 200:
@@ -177,31 +419,94 @@ def get_token():
         logger.error('CorfoGenerateCode - Error to get token, exception: {}'.format(str(e)))
         return {'result':'error'}
 
+@metrics.timed('token')
 def get_credentential():
     """
-       Get corfo token and save it in cache if fail return None
+       Get corfo token from cache, if it is missing only one worker ask CORFO
+       for a new one while the others wait for it. If fail return None
     """
-    token = cache.get("corfogeneratecode-token")
-    if token is None:
-        data = get_token()
-        """
-        {
-            "access_token":"asdadasdsa",
-            "token_type":"Bearer",
-            "expires_in":3600,
-            "scope":"resource.READ",
-            "appName":"Universidad de Chile"
-            "result": 'success'
-        }
-        """
-        if data['result'] == 'error':
-            token = None
-        else:
-            token = data['access_token']
-            cache.set("corfogeneratecode-token", token, 60*30)
-    
-    return token
+    data = cache.get(TOKEN_CACHE_KEY)
+    if data is not None:
+        metrics.increment('corfogeneratecode.token.hit')
+        if time.time() >= data['refresh_at']:
+            refresh_token_async()
+        return data['access_token']
+    metrics.increment('corfogeneratecode.token.miss')
+    lock_timeout = get_token_lock_timeout()
+    deadline = time.time() + lock_timeout
+    while True:
+        with cache_lock(TOKEN_LOCK_KEY, lock_timeout) as acquired:
+            if acquired:
+                data = cache.get(TOKEN_CACHE_KEY)
+                if data is not None:
+                    return data['access_token']
+                return refresh_token()
+        data = cache.get(TOKEN_CACHE_KEY)
+        if data is not None:
+            return data['access_token']
+        if time.time() >= deadline:
+            logger.error('CorfoGenerateCode - Timeout waiting token refresh')
+            return None
+        time.sleep(TOKEN_LOCK_POLL)
+
+def refresh_token():
+    """
+       Get a new token from CORFO and save it in cache for expires_in minus
+       CORFOGENERATE_TOKEN_EXPIRY_MARGIN seconds. If fail return None
+    """
+    data = get_token()
+    """
+    {
+        "access_token":"asdadasdsa",
+        "token_type":"Bearer",
+        "expires_in":3600,
+        "scope":"resource.READ",
+        "appName":"Universidad de Chile"
+        "result": 'success'
+    }
+    """
+    if data['result'] == 'error':
+        return None
+    metrics.increment('corfogeneratecode.token.refresh')
+    try:
+        expires_in = int(data['expires_in'])
+    except (KeyError, TypeError, ValueError):
+        expires_in = TOKEN_DEFAULT_EXPIRES_IN
+    timeout = max(expires_in - settings.CORFOGENERATE_TOKEN_EXPIRY_MARGIN, 1)
+    token = {
+        'access_token': data['access_token'],
+        'refresh_at': time.time() + timeout - settings.CORFOGENERATE_TOKEN_REFRESH_BEFORE
+    }
+    cache.set(TOKEN_CACHE_KEY, token, timeout)
+    return token['access_token']
+
+def invalidate_token(token):
+    """
+       Drop token from cache if it is still the cached one,
+       a token refreshed by other worker is kept
+    """
+    data = cache.get(TOKEN_CACHE_KEY)
+    if data is not None and data['access_token'] == token:
+        cache.delete(TOKEN_CACHE_KEY)
+
+def refresh_token_async():
+    """
+       Refresh the token in a background thread before it expires,
+       only one worker refresh it at a time
+    """
+    lock_token = acquire_lock(TOKEN_LOCK_KEY, get_token_lock_timeout())
+    if lock_token is None:
+        return
+    def run():
+        try:
+            refresh_token()
+        except Exception:
+            logger.exception('CorfoGenerateCode - Error to refresh token')
+        finally:
+            release_lock(TOKEN_LOCK_KEY, lock_token)
+    threading.Thread(target=run, name='corfogeneratecode-token-refresh', daemon=True).start()
 
+@metrics.timed('validate_mooc')
 def validate_mooc(token, code, score, id_content, user_rut, email, id_institution):
     """
        Post to Corfo with user data
@@ -221,7 +526,7 @@ def validate_mooc(token, code, score, id_content, user_rut, email, id_institutio
     }
     message_error = {"Message":"An error has occurred."}
     try:
-        r = requests.post(
+        r = client.post_with_retry(
             settings.CORFOGENERATE_URL_VALIDATE,
             data=body,
             headers=headers, verify=False)
@@ -238,6 +543,8 @@ def validate_mooc(token, code, score, id_content, user_rut, email, id_institutio
             return data
         else:
             logger.error('CorfoGenerateCode - Error to validate api, user_rut: {}, response: {}, response_status_code: {}'.format(user_rut, r.text, r.status_code))
+            if r.status_code == 401:
+                return {'result':'unauthorized'}
             return {'result':'error'}
     except Exception as e:
         logger.error('CorfoGenerateCode - Error to validate_mooc, exception: {}'.format(str(e)))
@@ -245,20 +552,43 @@ def validate_mooc(token, code, score, id_content, user_rut, email, id_institutio
 
 def generate_code_corfo(user_id):
     """
-       Generate Corfo Code
+       Generate Corfo Code with a code claimed from the pool,
+       a random one if the pool is empty. Must be called inside transaction.atomic()
     """
-    aux_code = BaseUserManager().make_random_password(8).upper()
+    aux_code = claim_code() or random_code()
     code = 'U{}COD{}'.format(user_id, aux_code)
     return code
 
+def get_course_edited_on(course_key):
+    """
+       Get the last publish datetime of course (subtree_edited_on), cached until the course is published again.
+       None if the course does not exist
+    """
+    edited_on = get_cached_course_edited_on(course_key)
+    if edited_on is not None:
+        return edited_on
+    try:
+        edited_on = get_course_by_id(course_key).subtree_edited_on
+    except (InvalidKeyError, Http404) as exception:
+        logger.error('CorfoGenerateCode - Error to get course edited on, course: {}, exception: {}'.format(str(course_key), str(exception)))
+        return None
+    if edited_on is not None:
+        set_cached_course_edited_on(course_key, edited_on)
+    return edited_on
+
+@metrics.timed('grade_cutoff')
 def get_grade_cutoff(course_key):
     """
-       Get course grade_cutoffs
+       Get course grade_cutoffs, cached until the course is published again
     """
+    grade_cutoff = get_cached_grade_cutoff(course_key)
+    if grade_cutoff is not None:
+        return grade_cutoff
     # Load the course and user objects
     try:
         course = get_course_by_id(course_key)
         grade_cutoff = min(course.grade_cutoffs.values())  # Get the min value
+        set_cached_grade_cutoff(course_key, grade_cutoff)
         return grade_cutoff
     # For any course or user exceptions, kick the user back to the "Invalid" screen
     except (InvalidKeyError, Http404) as exception:
@@ -268,16 +598,3 @@ def get_grade_cutoff(course_key):
         )
         logger.error(error_str, str(course_key), str(exception))
         return None
-
-def grade_percent_scaled(grade_percent, grade_cutoff):
-    """
-        EOL: Scale grade percent by grade cutoff. Grade between 1.0 - 7.0
-    """
-    if grade_percent == 0.:
-        return 1.
-    if grade_percent < grade_cutoff:
-        return round_up((Decimal('3') / Decimal(str(grade_cutoff)) * Decimal(str(grade_percent)) + Decimal('1')))
-    return round_up(Decimal('3') / Decimal(str(1. - grade_cutoff)) * Decimal(str(grade_percent)) + (Decimal('7') - (Decimal('3') / Decimal(str(1. - grade_cutoff)))))
-
-def round_up(number):
-    return float(Decimal(str(float(number))).quantize(Decimal('0.1'), ROUND_HALF_UP))
@@ -28,6 +28,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         'XBlock',
+        'numpy',
         ],
     classifiers=[
         "Programming Language :: Python :: 2",